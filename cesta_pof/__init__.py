@@ -0,0 +1,70 @@
+"""
+Rotinas de apoio à análise da cesta de consumo a partir dos microdados da POF.
+
+As funções principais ficam disponíveis direto no pacote, mas cada submódulo só
+é importado no primeiro acesso (importar cesta_pof não carrega pandas nem
+matplotlib):
+
+    import cesta_pof
+    resultado = cesta_pof.analisar_arquivo('POF2018.csv', uf=26)
+    cesta_pof.relatorio_uf(resultado).salvar_excel('relatorio.xlsx')
+"""
+import importlib
+
+# nome público -> submódulo que o define
+_API = {
+    # carregamento
+    'carregar_pof': 'ingestao',
+    'ler_fator_expansao': 'ingestao',
+    # classificação
+    'carregar_esquema': 'classificacao',
+    'classificar': 'classificacao',
+    # agregação, corte de outliers e linha de pobreza
+    'agregar_base': 'cestas',
+    'cesta_por_grupo': 'cestas',
+    'deflacionar': 'cestas',
+    'aparar_outliers_mad': 'cestas',
+    'calcular_cesta': 'cestas',
+    'calcular_cestas': 'cestas',
+    'carregar_exclusoes': 'cestas',
+    'agregar_arquivos': 'incremental',
+    'agregar_por_uf': 'incremental',
+    'ITENS_EXCLUIDOS_MANCINI': 'cestas',
+    # estatísticas ponderadas pelo fator de expansão
+    'anexar_fator_expansao': 'cestas',
+    'quantil_ponderado': 'ponderado',
+    'mad_ponderado': 'ponderado',
+    # cestas contrafactuais (matriz esparsa domicílio x subitem)
+    'matriz_subitens': 'matriz',
+    'avaliar_exclusoes': 'matriz',
+    'candidatos_marginais': 'matriz',
+    # análise completa e tabelas
+    'analisar_arquivo': 'pipeline',
+    'analisar_uf': 'pipeline',
+    'analisar_base': 'pipeline',
+    'tabelas_consolidadas': 'pipeline',
+    'composicao_ate_linha': 'composicao',
+    # exportação
+    'relatorio_uf': 'pipeline',
+    'Relatorio': 'relatorio',
+    # gráficos
+    'gerar_graficos': 'graficos',
+    # infraestrutura
+    'CacheEtapas': 'cache',
+    'Execucao': 'instrumentacao',
+    'executar_todos_estados': 'lote',
+}
+
+__all__ = sorted(_API)
+
+
+def __getattr__(nome):
+    if nome not in _API:
+        raise AttributeError(f"module 'cesta_pof' has no attribute '{nome}'")
+    valor = getattr(importlib.import_module(f'cesta_pof.{_API[nome]}'), nome)
+    globals()[nome] = valor
+    return valor
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_API))
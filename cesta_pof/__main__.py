@@ -0,0 +1,5 @@
+import sys
+
+from cesta_pof.cli import main
+
+sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Benchmark por etapa do pipeline sobre dados sintéticos.
+
+Gera um CSV sintético (cesta_pof.sintetico) e mede separadamente cada etapa:
+ingestão (com e sem o cache Parquet), classificação, pivot, corte MAD, quantis,
+tabelas de pesos, composição até a linha, exportação e gráficos. Para cada
+etapa registra tempo de parede, tempo de CPU, pico de memória alocada
+(tracemalloc) e o pico de RSS do processo. Os resultados vão para um JSON,
+para comparar versões. As medidas vêm de cesta_pof.instrumentacao.
+
+O tracemalloc deixa as etapas mais lentas; use --sem-memoria para medir só o
+tempo. Os gráficos são desenhados em outros processos, fora da medição de memória.
+
+Uso:
+    python -m cesta_pof.benchmark --linhas 1000000 --saida benchmark.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cesta_pof.cestas import (
+    CESTAS_PADRAO,
+    FATOR_DEFLACAO,
+    MULTIPLICADOR_MAD,
+    QUANTIL_POBREZA,
+    ResultadoCesta,
+    agregar_base,
+    aparar_outliers_mad,
+    cesta_por_grupo,
+    deflacionar,
+    pesos_grupos,
+    pesos_subitens,
+)
+from cesta_pof.classificacao import classificar
+from cesta_pof.composicao import composicao_ate_linha
+from cesta_pof.ingestao import carregar_pof
+from cesta_pof.instrumentacao import Execucao, etapa
+from cesta_pof.pipeline import ResultadoUF, relatorio_uf, tabela_desigualdade, tabela_faixa, tabela_real_vs_nominal
+from cesta_pof.sintetico import gerar_csv
+
+UF_PADRAO = 35
+
+
+def _versao():
+    try:
+        saida = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return saida.stdout.strip() or None
+
+
+def _pivot(df, variantes):
+    base = agregar_base(df)
+    return base, {nome: cesta_por_grupo(base, excluir) for nome, excluir in variantes.items()}
+
+
+def _aparar(agregados, fator_deflacao, multiplicador_mad):
+    return {nome: aparar_outliers_mad(deflacionar(agregado.copy(), fator_deflacao), multiplicador_mad)
+            for nome, (agregado, _) in agregados.items()}
+
+
+def _quantis(finais, quantil):
+    tabelas = {}
+    for nome, (df_final, _) in finais.items():
+        linha = df_final['gasto_real'].quantile(quantil)
+        tabelas[nome] = (linha, tabela_real_vs_nominal(df_final, linha, quantil=quantil),
+                         tabela_faixa(df_final, linha), tabela_desigualdade(df_final))
+    return tabelas
+
+
+def _pesos(base, agregados, finais, linhas, variantes):
+    cestas, detalhes = {}, {}
+    for nome, (df_final, limites) in finais.items():
+        agregado, removidos = agregados[nome]
+        cestas[nome] = ResultadoCesta(nome=nome, excluir=list(variantes[nome]), df_agregado=agregado,
+                                      df_final=df_final, linha_pobreza=linhas[nome][0],
+                                      pesos=pesos_grupos(df_final, list(agregado.columns)),
+                                      registros_removidos=removidos, limites_mad=limites)
+        detalhes[nome] = pesos_subitens(base, cestas[nome])
+    return cestas, detalhes
+
+
+def _graficos(resultado, diretorio):
+    from cesta_pof.graficos import gerar_graficos
+    return [futuro.result() for futuro in gerar_graficos(resultado, diretorio)]
+
+
+def executar_benchmark(linhas, uf=UF_PADRAO, semente=0, diretorio=None, graficos=True, memoria=True,
+                       fator_deflacao=FATOR_DEFLACAO, quantil=QUANTIL_POBREZA, multiplicador_mad=MULTIPLICADOR_MAD):
+    """
+    Executa o benchmark sobre `linhas` registros sintéticos e devolve o dicionário de resultados.
+
+    As etapas depois da ingestão usam os registros da UF `uf`; a cesta de
+    referência é a Refinada, como na análise de Pernambuco.
+    """
+    variantes = CESTAS_PADRAO
+    with tempfile.TemporaryDirectory(dir=diretorio) as tmp:
+        csv = os.path.join(tmp, 'pof_sintetica.csv')
+        dir_cache = os.path.join(tmp, 'cache')
+        # A geração é preparação, não etapa do pipeline: só o tempo, sem tracemalloc
+        inicio = time.perf_counter()
+        gerar_csv(csv, linhas, semente=semente)
+        segundos_geracao = time.perf_counter() - inicio
+
+        with Execucao(f'benchmark_{linhas}', memoria=memoria) as execucao:
+            with etapa('ingestao', linhas_entrada=linhas) as registro:
+                registro['linhas_saida'] = len(carregar_pof(csv, dir_cache=dir_cache))
+            with etapa('ingestao_cache', linhas_entrada=linhas) as registro:
+                df = carregar_pof(csv, uf=uf, dir_cache=dir_cache)
+                registro['linhas_saida'] = len(df)
+
+            with etapa('classificacao', linhas_entrada=len(df), linhas_saida=len(df)):
+                df = df.assign(nome_grupo=classificar(df['cod_subitem']))
+            with etapa('pivot', linhas_entrada=len(df)) as registro:
+                base, agregados = _pivot(df, variantes)
+                registro['linhas_saida'] = len(base.por_grupo)
+
+            with etapa('aparar_mad', linhas_entrada=len(base.por_grupo)) as registro:
+                finais = _aparar(agregados, fator_deflacao, multiplicador_mad)
+                registro['linhas_saida'] = len(finais['Refinada'][0])
+            with etapa('quantis', linhas_entrada=len(finais['Refinada'][0])):
+                tabelas = _quantis(finais, quantil)
+            with etapa('pesos', linhas_entrada=len(base.subitens)):
+                cestas, detalhes = _pesos(base, agregados, finais, tabelas, variantes)
+
+            referencia = cestas['Refinada']
+            with etapa('composicao', linhas_entrada=len(referencia.df_final)) as registro:
+                composicao = composicao_ate_linha(base, referencia.df_final, referencia.linha_pobreza,
+                                                  referencia.excluir)
+                registro['linhas_saida'] = len(composicao[1])
+
+            _, tabela_hcr, faixa, desigualdade = tabelas['Refinada']
+            resultado = ResultadoUF(uf=uf, base=base, cestas=cestas, cesta_referencia='Refinada', detalhes=detalhes,
+                                    tabela_hcr=tabela_hcr, tabela_faixa=faixa, tabela_desigualdade=desigualdade,
+                                    composicao_grupo=composicao[0], composicao_subitem=composicao[1])
+            with etapa('exportacao'):
+                relatorio_uf(resultado).salvar_excel(os.path.join(tmp, 'relatorio.xlsx'))
+            if graficos:
+                try:
+                    with etapa('graficos'):
+                        _graficos(resultado, tmp)
+                except ImportError:
+                    print("\nAVISO: Para medir os gráficos, a biblioteca 'matplotlib' é necessária.")
+                    print("Por favor, instale-a usando o comando: pip install matplotlib")
+
+    return {
+        'versao': _versao(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'linhas': linhas,
+        'uf': uf,
+        'semente': semente,
+        'memoria_medida': memoria,
+        'segundos_geracao': segundos_geracao,
+        'ambiente': {
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'nucleos': os.cpu_count(),
+        },
+        'etapas': execucao.resumo()['etapas'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapa do pipeline sobre dados sintéticos da POF.")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[100_000],
+                        help="tamanhos a medir (ex.: 100000 1000000 10000000)")
+    parser.add_argument('--uf', type=int, default=UF_PADRAO, help="UF usada nas etapas depois da ingestão")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--saida', default='benchmark.json', help="arquivo JSON com os resultados")
+    parser.add_argument('--dir-temporario', help="onde gravar o CSV e o cache temporários")
+    parser.add_argument('--sem-graficos', action='store_true')
+    parser.add_argument('--sem-memoria', action='store_true', help="não usa tracemalloc (tempos mais fiéis)")
+    args = parser.parse_args(argv)
+
+    resultados = []
+    for linhas in args.linhas:
+        resultado = executar_benchmark(linhas, uf=args.uf, semente=args.semente, diretorio=args.dir_temporario,
+                                       graficos=not args.sem_graficos, memoria=not args.sem_memoria)
+        resultados.append(resultado)
+        print(f"\n{linhas} linhas:")
+        print(pd.DataFrame(resultado['etapas']).to_string(index=False, float_format='{:.3f}'.format))
+
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em '{args.saida}'.")
+
+
+if __name__ == '__main__':
+    main()
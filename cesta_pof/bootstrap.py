@@ -0,0 +1,169 @@
+"""
+Intervalos de confiança por bootstrap para a linha de pobreza, HCR e pesos dos grupos.
+
+Os domicílios são ordenados uma única vez pelo gasto real. Cada lote de réplicas é
+uma matriz (réplicas x domicílios) com o número de vezes que cada domicílio foi
+sorteado, montada com um único np.bincount; quantis, HCR e pesos saem de somas
+acumuladas sobre essa matriz, sem laços em Python por réplica. Os sorteios podem
+respeitar estratos (reamostragem dentro de cada estrato) e pesos amostrais, e os
+lotes podem ser distribuídos entre processos.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cesta_pof.cestas import PERCENTUAIS_HCR, QUANTIL_POBREZA, rotulo_linha
+from cesta_pof.composicao import COLUNAS_TECNICAS
+from cesta_pof.ponderado import limiares_postos, normalizar_pesos
+
+REPLICAS_PADRAO = 10000
+NIVEL_PADRAO = 0.95
+# Limite aproximado de células por matriz de lote (réplicas x domicílios)
+CELULAS_POR_LOTE = 2_000_000
+
+
+def somas_acumuladas(pesos):
+    """Somas acumuladas por linha, com uma coluna de zeros à esquerda."""
+    acumulado = np.zeros((pesos.shape[0], pesos.shape[1] + 1))
+    np.cumsum(pesos, axis=1, out=acumulado[:, 1:])
+    return acumulado
+
+
+def quantil_linhas(valores_ordenados, acumulado, q):
+    """
+    Quantil q de cada réplica sobre os mesmos valores ordenados.
+
+    `acumulado` vem de somas_acumuladas(pesos), com pesos (réplicas x n). Com
+    pesos inteiros (contagens) é exatamente o quantil linear do pandas/NumPy sobre
+    a amostra expandida. Pesos amostrais devem vir normalizados para média 1
+    (ponderado.normalizar_pesos); a versão de uma amostra só é
+    ponderado.quantis_ponderados_ordenados.
+    """
+    acumulado = acumulado[:, 1:]
+    limiar_inf, limiar_sup, fracao = limiares_postos(acumulado[:, -1], q)
+    # Posição do primeiro domicílio cuja soma acumulada passa de cada posto
+    ultimo = len(valores_ordenados) - 1
+    i_inf = np.minimum((acumulado <= limiar_inf[:, None]).sum(axis=1), ultimo)
+    i_sup = np.minimum((acumulado <= limiar_sup[:, None]).sum(axis=1), ultimo)
+    v_inf = valores_ordenados[i_inf]
+    v_sup = valores_ordenados[i_sup]
+    return v_inf + fracao * (v_sup - v_inf)
+
+
+def proporcao_ate(valores_ordenados, acumulado, limiares):
+    """Parcela do peso de cada réplica com valor <= limiar da própria réplica."""
+    k = np.searchsorted(valores_ordenados, limiares, side='right')
+    return acumulado[np.arange(acumulado.shape[0]), k] / acumulado[:, -1]
+
+
+def estatisticas_lote(dados, pesos_linhas):
+    """Linha de pobreza, HCR_adj/HCR (%) por percentual e pesos dos grupos de cada réplica."""
+    real = dados['real']
+    nominal = dados['nominal']
+    acumulado = somas_acumuladas(pesos_linhas)
+    linha = quantil_linhas(real, acumulado, dados['quantil'])
+
+    colunas = [linha]
+    for pct in dados['percentuais']:
+        limiar = linha * (1 + pct)
+        colunas.append(proporcao_ate(real, acumulado, limiar) * 100)
+        colunas.append(proporcao_ate(nominal, acumulado, limiar) * 100)
+    somas_grupo = pesos_linhas @ dados['grupos']
+    colunas.extend((somas_grupo / somas_grupo.sum(axis=1, keepdims=True)).T)
+    return np.column_stack(colunas)
+
+
+def _contagens(gerador, estratos, n, replicas):
+    # Matriz (réplicas x n) com o número de sorteios de cada domicílio
+    deslocamento = (np.arange(replicas, dtype=np.int64) * n)[:, None]
+    planos = []
+    for membros in estratos:
+        sorteio = gerador.integers(0, len(membros), size=(replicas, len(membros)))
+        planos.append((membros[sorteio] + deslocamento).ravel())
+    return np.bincount(np.concatenate(planos), minlength=replicas * n).reshape(replicas, n)
+
+
+def _replicas_lote(dados, semente, replicas):
+    gerador = np.random.default_rng(semente)
+    contagens = _contagens(gerador, dados['estratos'], len(dados['real']), replicas)
+    pesos_linhas = contagens if dados['pesos'] is None else contagens * dados['pesos']
+    return estatisticas_lote(dados, pesos_linhas)
+
+
+def preparar_dados(df_final, quantil=QUANTIL_POBREZA, percentuais=PERCENTUAIS_HCR, pesos=None, estratos=None):
+    """Organiza os vetores do agregado final em ordem crescente de gasto real."""
+    grupos = [col for col in df_final.columns if col not in COLUNAS_TECNICAS]
+    ordem = np.argsort(df_final['gasto_real'].to_numpy(), kind='stable')
+    n = len(ordem)
+
+    if pesos is not None:
+        pesos = normalizar_pesos(np.asarray(pesos, dtype=float)[ordem])
+    if estratos is None:
+        membros = [np.arange(n)]
+    else:
+        estratos = np.asarray(estratos)[ordem]
+        membros = [np.flatnonzero(estratos == e) for e in pd.unique(estratos)]
+
+    return {
+        'real': df_final['gasto_real'].to_numpy(dtype=float)[ordem],
+        'nominal': df_final['gasto_nominal'].to_numpy(dtype=float)[ordem],
+        'grupos': df_final[grupos].to_numpy(dtype=float)[ordem],
+        'nomes_grupos': grupos,
+        'pesos': pesos,
+        'estratos': membros,
+        'quantil': quantil,
+        'percentuais': list(percentuais),
+    }
+
+
+def _nomes_estatisticas(dados):
+    nomes = [('linha_pobreza', '')]
+    for pct in dados['percentuais']:
+        rotulo = rotulo_linha(pct, dados['quantil'])
+        nomes.append(('HCR_adj (%)', rotulo))
+        nomes.append(('HCR (%)', rotulo))
+    nomes.extend(('peso_grupo', grupo) for grupo in dados['nomes_grupos'])
+    return nomes
+
+
+def bootstrap_cesta(df_final, replicas=REPLICAS_PADRAO, quantil=QUANTIL_POBREZA, percentuais=PERCENTUAIS_HCR,
+                    pesos=None, estratos=None, nivel=NIVEL_PADRAO, semente=None, processos=1,
+                    tamanho_lote=None, retornar_replicas=False):
+    """
+    Intervalos de confiança (percentil) para a linha de pobreza, HCR_adj, HCR e pesos dos grupos.
+
+    df_final é o agregado domicílio x grupo já sem outliers (ResultadoCesta.df_final);
+    pesos e estratos, se informados, são vetores alinhados às suas linhas. Retorna
+    um DataFrame com estimativa pontual, erro padrão e limites do intervalo; com
+    retornar_replicas=True retorna também a matriz de réplicas.
+    """
+    dados = preparar_dados(df_final, quantil, percentuais, pesos, estratos)
+    n = len(dados['real'])
+    if tamanho_lote is None:
+        tamanho_lote = max(1, CELULAS_POR_LOTE // max(n, 1))
+    lotes = [min(tamanho_lote, replicas - inicio) for inicio in range(0, replicas, tamanho_lote)]
+    sementes = np.random.SeedSequence(semente).spawn(len(lotes))
+
+    if processos == 1:
+        partes = [_replicas_lote(dados, s, r) for s, r in zip(sementes, lotes)]
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            partes = list(pool.map(_replicas_lote, [dados] * len(lotes), sementes, lotes))
+    matriz = np.vstack(partes)
+
+    pesos_pontuais = np.ones((1, n)) if dados['pesos'] is None else dados['pesos'][None, :]
+    estimativa = estatisticas_lote(dados, pesos_pontuais)[0]
+    alfa = (1 - nivel) / 2
+    nomes = _nomes_estatisticas(dados)
+    tabela = pd.DataFrame({
+        'estatistica': [nome for nome, _ in nomes],
+        'referencia': [ref for _, ref in nomes],
+        'estimativa': estimativa,
+        'erro_padrao': matriz.std(axis=0, ddof=1),
+        'ic_inferior': np.quantile(matriz, alfa, axis=0),
+        'ic_superior': np.quantile(matriz, 1 - alfa, axis=0),
+    })
+    if retornar_replicas:
+        return tabela, matriz
+    return tabela
@@ -0,0 +1,153 @@
+"""
+Cache das etapas intermediárias, endereçado pelo conteúdo.
+
+Cada artefato (registros classificados da UF, agregado base, agregado de cada
+lista de exclusão, cesta deflacionada e aparada, tabelas do relatório) é
+guardado sob uma chave que é o hash das suas entradas: a chave do artefato de
+que ele depende mais os parâmetros da própria etapa. Assim, mudar o deflator
+refaz só a deflação em diante e mudar a lista de exclusão refaz só as cestas
+afetadas.
+
+Os artefatos são gravados em disco (pickle) e o diretório é mantido abaixo de
+um limite de tamanho, descartando primeiro os menos usados recentemente.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from cesta_pof.classificacao import compilar_esquema
+
+DIR_CACHE_ETAPAS = os.path.join('.cache_pof', 'etapas')
+LIMITE_BYTES_PADRAO = 1 << 30
+# Incluída em todas as chaves; aumentar quando o formato de algum artefato mudar
+VERSAO_CACHE = 2
+_EXTENSAO = '.pkl'
+_AUSENTE = object()
+
+
+def _normalizar(valor):
+    # Representação estável (e independente de tipo NumPy/Python) para o hash
+    if isinstance(valor, dict):
+        return tuple(sorted((str(k), _normalizar(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_normalizar(v) for v in valor)
+    if isinstance(valor, np.ndarray):
+        return (valor.dtype.str, valor.shape, hashlib.sha256(np.ascontiguousarray(valor).tobytes()).hexdigest())
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+
+def chave(*partes):
+    """Hash SHA-256 (hex) das partes: chaves de artefatos anteriores, parâmetros, listas, arrays."""
+    return hashlib.sha256(repr((VERSAO_CACHE, _normalizar(partes))).encode('utf-8')).hexdigest()
+
+
+def chave_exclusoes(excluir):
+    """Parte da chave de uma lista de exclusão (a ordem e as repetições não importam)."""
+    return tuple(int(c) for c in np.unique(np.asarray(list(excluir), dtype=np.int64)))
+
+
+def chave_esquema(esquema=None):
+    """Parte da chave com o esquema de classificação já compilado (prefixo -> grupo)."""
+    return compilar_esquema(esquema)
+
+
+def chave_dataframe(df):
+    """Parte da chave com o conteúdo de um DataFrame (colunas e valores)."""
+    return (tuple(map(str, df.columns)), pd.util.hash_pandas_object(df, index=False).to_numpy())
+
+
+class CacheEtapas:
+    """Cache em disco de artefatos por chave, com limite de tamanho e descarte LRU."""
+
+    def __init__(self, diretorio=DIR_CACHE_ETAPAS, limite_bytes=LIMITE_BYTES_PADRAO):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self.acertos = 0
+        self.faltas = 0
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave_artefato):
+        return os.path.join(self.diretorio, chave_artefato + _EXTENSAO)
+
+    def __contains__(self, chave_artefato):
+        return os.path.exists(self._caminho(chave_artefato))
+
+    def obter(self, chave_artefato, padrao=None):
+        """Artefato guardado sob a chave, ou `padrao`. Um acerto conta como uso recente."""
+        caminho = self._caminho(chave_artefato)
+        try:
+            with open(caminho, 'rb') as f:
+                valor = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.faltas += 1
+            return padrao
+        os.utime(caminho)
+        self.acertos += 1
+        return valor
+
+    def guardar(self, chave_artefato, valor):
+        """Grava o artefato (de forma atômica) e aplica o limite de tamanho."""
+        fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, self._caminho(chave_artefato))
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        self.aplicar_limite(manter=chave_artefato)
+        return valor
+
+    def memo(self, chave_artefato, funcao):
+        """Devolve o artefato da chave; se não existir, calcula com funcao() e guarda."""
+        valor = self.obter(chave_artefato, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = self.guardar(chave_artefato, funcao())
+        return valor
+
+    def arquivos(self):
+        """(caminho, tamanho, último uso) de cada artefato, do menos para o mais recente."""
+        itens = []
+        for entrada in os.scandir(self.diretorio):
+            if entrada.name.endswith(_EXTENSAO):
+                info = entrada.stat()
+                itens.append((entrada.path, info.st_size, info.st_mtime))
+        return sorted(itens, key=lambda item: item[2])
+
+    def tamanho(self):
+        """Tamanho total dos artefatos em bytes."""
+        return sum(tamanho for _, tamanho, _ in self.arquivos())
+
+    def aplicar_limite(self, manter=None):
+        """Remove os artefatos menos usados até o total caber no limite. Retorna quantos removeu."""
+        if self.limite_bytes is None:
+            return 0
+        itens = self.arquivos()
+        total = sum(tamanho for _, tamanho, _ in itens)
+        preservado = self._caminho(manter) if manter else None
+        removidos = 0
+        for caminho, tamanho, _ in itens:
+            if total <= self.limite_bytes:
+                break
+            if caminho == preservado:
+                continue
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+            removidos += 1
+        return removidos
+
+    def limpar(self):
+        """Remove todos os artefatos."""
+        for caminho, _, _ in self.arquivos():
+            os.remove(caminho)
+
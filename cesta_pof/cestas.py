@@ -0,0 +1,301 @@
+"""
+Motor de cestas de consumo.
+
+Os registros de despesa são agregados uma única vez por domicílio x grupo e por
+domicílio x subitem. Cada variante da cesta (Bruta, Refinada ou qualquer outra
+lista de exclusão) é derivada do agregado base subtraindo as colunas dos subitens
+excluídos, sem voltar aos registros. Sobre o agregado de cada variante aplicam-se
+a deflação, o corte de outliers por MAD e a linha de pobreza. Se o agregado base
+tiver o fator de expansão dos domicílios, mediana, MAD, quantil e pesos dos
+grupos são ponderados (cesta_pof.ponderado).
+"""
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+import pandas as pd
+
+from cesta_pof.instrumentacao import etapa
+from cesta_pof.ponderado import mad_ponderado, quantil_ponderado
+
+FATOR_DEFLACAO = 0.94
+QUANTIL_POBREZA = 0.35
+MULTIPLICADOR_MAD = 3
+FATOR_SIGMA_MAD = 1.4826
+# Variações da linha de pobreza nas tabelas Real vs Nominal
+PERCENTUAIS_HCR = [0.10, 0.05, 0.0, -0.05, -0.10]
+
+# Subitens retirados da cesta refinada (critérios de Mancini)
+ITENS_EXCLUIDOS_MANCINI = [
+    1201009, 3101002, 3101003, 3101015, 3101016, 3101017, 3201001, 3201002, 3201006, 3201013, 3201021, 3201050, 3202001, 3202003, 3202028,
+    2103039, 2103040, 2103042, 2103048, 2103055, 6202004, 5102053, 7201010, 7201019, 7201095, 1201048, 1201061, 1201003, 1201001, 1201007,
+    7101034, 7101036, 7201063, 7201090, 2103005, 2103049, 3301022, 5102004, 5102011, 5102051, 5101010, 5102037, 5102010, 4301002, 4301004,
+    3102007, 3102009, 3102010
+]
+
+CESTAS_PADRAO = {
+    'Bruta': [],
+    'Refinada': ITENS_EXCLUIDOS_MANCINI,
+}
+
+
+def carregar_exclusoes(caminho):
+    """
+    Lê uma lista de subitens excluídos: códigos separados por linhas, espaços ou
+    vírgulas; linhas iniciadas por '#' e um cabeçalho 'cod_subitem' são ignorados.
+    """
+    codigos = []
+    with open(caminho, encoding='utf-8') as f:
+        for numero, linha in enumerate(f, start=1):
+            linha = linha.split('#', 1)[0]
+            for item in linha.replace(',', ' ').split():
+                if item == 'cod_subitem':
+                    continue
+                try:
+                    codigos.append(int(item))
+                except ValueError:
+                    raise ValueError(f"Código de subitem inválido na linha {numero} de '{caminho}': '{item}'") from None
+    return codigos
+
+
+@dataclass
+class AgregadoBase:
+    """Agregados dos registros de despesa, calculados uma vez por conjunto de dados."""
+    por_grupo: pd.DataFrame       # domicílio x grupo: soma do gasto
+    contagem_grupo: pd.DataFrame  # domicílio x grupo: número de registros
+    por_subitem: pd.DataFrame     # (cod_subitem, domicilio, uf, gasto, n_registros), ordenado por cod_subitem
+    subitens: pd.DataFrame        # por cod_subitem, na ordem de aparição: subitem, nome_grupo, gasto, n_registros
+    fator_expansao: pd.Series = None  # peso amostral de cada domicílio, no índice de por_grupo (None: sem pesos)
+
+
+@dataclass
+class ResultadoCesta:
+    """Resultado de uma variante da cesta."""
+    nome: str
+    excluir: list
+    df_agregado: pd.DataFrame
+    df_final: pd.DataFrame
+    linha_pobreza: float
+    pesos: pd.Series
+    registros_removidos: int = 0
+    limites_mad: tuple = field(default=(np.nan, np.nan))
+    fator_expansao: pd.Series = None  # peso amostral de cada domicílio de df_final (None: sem pesos)
+
+    @property
+    def grupos(self):
+        return list(self.pesos.index)
+
+
+def agregar_base(df_registros):
+    """Agrega os registros classificados (com 'nome_grupo') por domicílio x grupo e x subitem."""
+    por_grupo_longo = df_registros.groupby(['domicilio', 'uf', 'nome_grupo'], observed=True)['gasto'].agg(['sum', 'count'])
+    por_grupo = por_grupo_longo['sum'].unstack(fill_value=0)
+    contagem_grupo = por_grupo_longo['count'].unstack(fill_value=0).astype('int32')
+    for df in (por_grupo, contagem_grupo):
+        df.columns = pd.Index(df.columns.astype(str), name='nome_grupo')
+
+    por_subitem = (
+        df_registros.groupby(['cod_subitem', 'domicilio', 'uf'], sort=True)['gasto']
+        .agg(['sum', 'count'])
+        .rename(columns={'sum': 'gasto', 'count': 'n_registros'})
+        .reset_index()
+    )
+    por_subitem['n_registros'] = por_subitem['n_registros'].astype('int32')
+
+    subitens = df_registros.drop_duplicates('cod_subitem').set_index('cod_subitem')[['subitem', 'nome_grupo']]
+    subitens = subitens.assign(subitem=subitens['subitem'].astype(str), nome_grupo=subitens['nome_grupo'].astype(str))
+    totais = df_registros.groupby('cod_subitem')['gasto'].agg(['sum', 'count'])
+    subitens['gasto'] = totais['sum']
+    subitens['n_registros'] = totais['count']
+
+    return AgregadoBase(por_grupo, contagem_grupo, por_subitem, subitens)
+
+
+def anexar_fator_expansao(base, fator_expansao):
+    """
+    Agregado base com o fator de expansão de cada domicílio.
+
+    fator_expansao é uma Series indexada por (domicilio, uf), como a de
+    ingestao.ler_fator_expansao. Levanta ValueError se algum domicílio ficar sem
+    peso, tiver peso negativo ou pesos diferentes (p. ex. em dois arquivos).
+    """
+    if fator_expansao.index.has_duplicates:
+        # O mesmo domicílio em mais de um arquivo: só é aceito com o mesmo peso
+        if (fator_expansao.groupby(level=[0, 1]).nunique() > 1).any():
+            raise ValueError("Fator de expansão diferente para o mesmo domicílio")
+        fator_expansao = fator_expansao[~fator_expansao.index.duplicated()]
+    fator = fator_expansao.reindex(base.por_grupo.index).astype('float64').rename('fator_expansao')
+    if fator.isna().any():
+        raise ValueError(f"{int(fator.isna().sum())} domicílios sem fator de expansão")
+    if (fator < 0).any():
+        raise ValueError("Fator de expansão negativo")
+    return replace(base, fator_expansao=fator)
+
+
+def _normalizar_exclusoes(excluir):
+    return np.unique(np.asarray(list(excluir), dtype=np.int64))
+
+
+def registros_excluidos(base, excluir):
+    """Linhas de base.por_subitem dos subitens excluídos (busca binária por código)."""
+    excluir = _normalizar_exclusoes(excluir)
+    codigos = base.por_subitem['cod_subitem'].to_numpy()
+    inicio = np.searchsorted(codigos, excluir, side='left')
+    fim = np.searchsorted(codigos, excluir, side='right')
+    if not len(excluir) or not (fim - inicio).any():
+        return base.por_subitem.iloc[:0]
+    linhas = np.concatenate([np.arange(a, b) for a, b in zip(inicio, fim)])
+    return base.por_subitem.iloc[linhas]
+
+
+def cesta_por_grupo(base, excluir=()):
+    """
+    Agregado domicílio x grupo da cesta sem os subitens de `excluir`.
+
+    Equivale ao pivot_table dos registros filtrados: domicílios e grupos que
+    ficam sem nenhum registro deixam de aparecer. Retorna (agregado, registros removidos).
+    """
+    removidos = registros_excluidos(base, excluir)
+    if removidos.empty:
+        return base.por_grupo.copy(), 0
+
+    grupo = removidos['cod_subitem'].map(base.subitens['nome_grupo'])
+    soma = removidos.assign(nome_grupo=grupo.to_numpy()).groupby(['domicilio', 'uf', 'nome_grupo'])[['gasto', 'n_registros']].sum()
+    gasto_removido = soma['gasto'].unstack(fill_value=0).reindex(
+        index=base.por_grupo.index, columns=base.por_grupo.columns, fill_value=0)
+    contagem_removida = soma['n_registros'].unstack(fill_value=0).reindex(
+        index=base.por_grupo.index, columns=base.por_grupo.columns, fill_value=0)
+
+    contagem = base.contagem_grupo - contagem_removida
+    # Células sem registros restantes voltam a zero exato (sem resíduo da subtração)
+    agregado = (base.por_grupo - gasto_removido).where(contagem > 0, 0.0)
+    agregado = agregado.loc[contagem.sum(axis=1) > 0, contagem.sum(axis=0) > 0]
+    return agregado, int(removidos['n_registros'].sum())
+
+
+def deflacionar(df_agregado, fator_deflacao=FATOR_DEFLACAO):
+    """Acrescenta gasto_nominal, gasto_real e log_gasto_real ao agregado domicílio x grupo."""
+    colunas_de_gasto = list(df_agregado.columns)
+    df_agregado['gasto_nominal'] = df_agregado[colunas_de_gasto].sum(axis=1)
+    df_agregado['gasto_real'] = df_agregado['gasto_nominal'] / fator_deflacao
+    df_agregado['log_gasto_real'] = np.log(df_agregado['gasto_real'] + 1)
+    return df_agregado
+
+
+def limites_mad(log_gasto, multiplicador_mad=MULTIPLICADOR_MAD, pesos=None):
+    """Limites (inferior, superior) da mediana +- multiplicador * sigma_MAD (ponderados, com pesos)."""
+    if pesos is None:
+        mediana = np.median(log_gasto)
+        mad = np.median(np.abs(log_gasto - mediana))
+    else:
+        mediana, mad = mad_ponderado(log_gasto, pesos)
+    sigma_mad = FATOR_SIGMA_MAD * mad
+    return mediana - multiplicador_mad * sigma_mad, mediana + multiplicador_mad * sigma_mad
+
+
+def aparar_outliers_mad(df_agregado, multiplicador_mad=MULTIPLICADOR_MAD, pesos=None):
+    """Remove os domicílios com log_gasto_real fora dos limites de MAD. Retorna (df_final, limites)."""
+    limites = limites_mad(df_agregado['log_gasto_real'].to_numpy(), multiplicador_mad, pesos)
+    df_final = df_agregado[
+        (df_agregado['log_gasto_real'] >= limites[0]) &
+        (df_agregado['log_gasto_real'] <= limites[1])
+    ].copy()
+    return df_final, limites
+
+
+def pesos_grupos(df_final, grupos, pesos=None):
+    """Peso de cada grupo no gasto total (ponderado pelo fator de expansão, se houver), em ordem decrescente."""
+    if pesos is None:
+        somas = df_final[grupos].sum()
+    else:
+        somas = pd.Series(np.asarray(pesos, dtype=float) @ df_final[grupos].to_numpy(dtype=float), index=grupos)
+    return (somas / somas.sum()).sort_values(ascending=False, kind='stable')
+
+
+def calcular_cesta(base, nome, excluir=(), fator_deflacao=FATOR_DEFLACAO, quantil=QUANTIL_POBREZA,
+                   multiplicador_mad=MULTIPLICADOR_MAD, agregado=None):
+    """
+    Deriva uma variante da cesta a partir do agregado base.
+
+    agregado, se informado, é o resultado já calculado de cesta_por_grupo(base, excluir).
+    """
+    with etapa(f'cesta_{nome}', linhas_entrada=len(base.por_grupo)) as registro:
+        if agregado is None:
+            df_agregado, removidos = cesta_por_grupo(base, excluir)
+        else:
+            df_agregado, removidos = agregado[0].copy(), agregado[1]
+        grupos = list(df_agregado.columns)
+        deflacionar(df_agregado, fator_deflacao)
+        if base.fator_expansao is None:
+            fator = None
+            df_final, limites = aparar_outliers_mad(df_agregado, multiplicador_mad)
+            linha_pobreza = df_final['gasto_real'].quantile(quantil)
+        else:
+            pesos = base.fator_expansao.reindex(df_agregado.index).to_numpy()
+            df_final, limites = aparar_outliers_mad(df_agregado, multiplicador_mad, pesos)
+            fator = base.fator_expansao.reindex(df_final.index)
+            linha_pobreza = float(quantil_ponderado(df_final['gasto_real'].to_numpy(), fator.to_numpy(), quantil))
+        registro.update({
+            'linhas_saida': len(df_final),
+            'registros_excluidos': removidos,
+            'domicilios_sem_registros': len(base.por_grupo) - len(df_agregado),
+            'descartadas_mad': len(df_agregado) - len(df_final),
+        })
+    return ResultadoCesta(
+        nome=nome,
+        excluir=list(excluir),
+        df_agregado=df_agregado,
+        df_final=df_final,
+        linha_pobreza=linha_pobreza,
+        pesos=pesos_grupos(df_final, grupos, None if fator is None else fator.to_numpy()),
+        registros_removidos=removidos,
+        limites_mad=limites,
+        fator_expansao=fator,
+    )
+
+
+def calcular_cestas(base, variantes=None, **parametros):
+    """Calcula todas as variantes {nome: lista de exclusão} sobre o mesmo agregado base."""
+    if variantes is None:
+        variantes = CESTAS_PADRAO
+    return {nome: calcular_cesta(base, nome, excluir, **parametros) for nome, excluir in variantes.items()}
+
+
+def rotulo_linha(pct, quantil=QUANTIL_POBREZA):
+    """Rótulo da linha ajustada: 'P35' na própria linha, '+5%', '-10%' etc. nas demais."""
+    if pct == 0:
+        return f"P{quantil * 100:g}"
+    return f"{int(pct*100):+d}%"
+
+
+def gasto_subitens(base):
+    """Gasto total de cada subitem, expandido pelo fator de expansão dos domicílios se houver."""
+    if base.fator_expansao is None:
+        return base.subitens['gasto']
+    por_subitem = base.por_subitem
+    chave_domicilio = pd.MultiIndex.from_arrays([por_subitem['domicilio'], por_subitem['uf']])
+    pesos = base.fator_expansao.reindex(chave_domicilio).to_numpy()
+    return (por_subitem['gasto'] * pesos).groupby(por_subitem['cod_subitem'].to_numpy()).sum()
+
+
+def pesos_subitens(base, resultado):
+    """
+    Peso de cada subitem dentro do seu grupo, sobre todos os registros da cesta.
+
+    Os grupos seguem a ordem dos pesos da cesta e, dentro de cada grupo, os
+    subitens vêm em ordem decrescente de peso. 'Peso no Grupo (%)' está em 0-100.
+    """
+    excluir = _normalizar_exclusoes(resultado.excluir)
+    subitens = base.subitens[~base.subitens.index.isin(excluir)]
+    ordem_grupo = {grupo: i for i, grupo in enumerate(resultado.grupos)}
+    subitens = subitens[subitens['nome_grupo'].isin(ordem_grupo)].sort_index()
+
+    detalhes = pd.DataFrame({
+        'grupo': subitens['nome_grupo'].to_numpy(),
+        'cod_subitem': subitens.index.to_numpy(),
+        'subitem': subitens['subitem'].to_numpy(),
+        'gasto': gasto_subitens(base).reindex(subitens.index).to_numpy(),
+    })
+    total_grupo = detalhes.groupby('grupo')['gasto'].transform('sum')
+    detalhes['Peso no Grupo (%)'] = (detalhes['gasto'] / total_grupo) * 100
+    ordem = np.lexsort((-detalhes['Peso no Grupo (%)'].to_numpy(), detalhes['grupo'].map(ordem_grupo).to_numpy()))
+    return detalhes.iloc[ordem].reset_index(drop=True)
@@ -0,0 +1,75 @@
+"""
+Classificação dos subitens de despesa em grupos de consumo.
+
+O grupo é definido pelo prefixo do código (cod_subitem // 100000) a partir de uma
+tabela de faixas (prefixo_inicial, prefixo_final, nome_grupo). A tabela é compilada
+em um vetor de consulta indexado pelo prefixo, de modo que a classificação de todos
+os registros é uma única indexação NumPy. Outros esquemas (IBGE, grupos do IPCA)
+podem ser carregados de um CSV com as mesmas colunas.
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+ESQUEMA_PADRAO = os.path.join(os.path.dirname(__file__), 'esquemas', 'grupos_pof.csv')
+GRUPO_PADRAO = 'Outras Despesas'
+DIVISOR_PREFIXO = 100000
+
+_COLUNAS_ESQUEMA = ['prefixo_inicial', 'prefixo_final', 'nome_grupo']
+
+
+def carregar_esquema(caminho=ESQUEMA_PADRAO):
+    """Lê uma tabela de classificação (prefixo_inicial, prefixo_final, nome_grupo)."""
+    esquema = pd.read_csv(caminho, dtype={'prefixo_inicial': 'int64', 'prefixo_final': 'int64', 'nome_grupo': 'str'})
+    faltantes = [c for c in _COLUNAS_ESQUEMA if c not in esquema.columns]
+    if faltantes:
+        raise ValueError(f"Tabela de classificação '{caminho}' sem as colunas: {', '.join(faltantes)}")
+    return esquema[_COLUNAS_ESQUEMA]
+
+
+def compilar_esquema(esquema=None, grupo_padrao=GRUPO_PADRAO):
+    """
+    Converte a tabela de faixas em (vetor de consulta, categorias).
+
+    O vetor tem uma posição por prefixo com o código da categoria do grupo. Quando
+    faixas se sobrepõem vale a primeira linha da tabela, como numa cadeia de ifs.
+    """
+    if esquema is None:
+        consulta, categorias = _compilar_padrao(grupo_padrao)
+        return consulta, list(categorias)
+    if not isinstance(esquema, pd.DataFrame):
+        esquema = pd.DataFrame(list(esquema), columns=_COLUNAS_ESQUEMA)
+
+    # Categorias em ordem alfabética, a mesma ordem das colunas de um pivot_table
+    categorias = sorted(set(esquema['nome_grupo']) | {grupo_padrao})
+    codigo_grupo = {nome: i for i, nome in enumerate(categorias)}
+
+    tamanho = int(esquema['prefixo_final'].max()) + 1 if len(esquema) else 1
+    consulta = np.full(tamanho, codigo_grupo[grupo_padrao], dtype=np.int16)
+    for inicio, fim, nome in reversed(list(esquema[_COLUNAS_ESQUEMA].itertuples(index=False))):
+        consulta[int(inicio):int(fim) + 1] = codigo_grupo[nome]
+    return consulta, categorias
+
+
+@lru_cache(maxsize=None)
+def _compilar_padrao(grupo_padrao):
+    # A tabela padrão é lida e compilada uma única vez por processo
+    consulta, categorias = compilar_esquema(carregar_esquema(), grupo_padrao)
+    consulta.flags.writeable = False
+    return consulta, tuple(categorias)
+
+
+def classificar(codigos, esquema=None, grupo_padrao=GRUPO_PADRAO, divisor=DIVISOR_PREFIXO):
+    """
+    Classifica códigos de subitem em grupos de consumo.
+
+    Retorna um pandas.Categorical; prefixos fora da tabela recebem o grupo padrão.
+    """
+    consulta, categorias = compilar_esquema(esquema, grupo_padrao)
+    prefixos = np.asarray(codigos, dtype=np.int64) // divisor
+    fora = (prefixos < 0) | (prefixos >= len(consulta))
+    codigos_grupo = consulta[np.where(fora, 0, prefixos)]
+    codigos_grupo[fora] = categorias.index(grupo_padrao)
+    return pd.Categorical.from_codes(codigos_grupo, categories=categorias)
@@ -0,0 +1,150 @@
+"""
+Linha de comando da análise de uma UF.
+
+Só o argparse é importado no início: pandas e o pipeline entram depois da
+leitura dos argumentos, e o matplotlib apenas se os gráficos forem pedidos.
+
+Uso:
+    python -m cesta_pof Consume_Basket_DRP/POF2018.csv --uf 26 --saida relatorio.xlsx
+    python -m cesta_pof dados.csv --uf 35 --deflator 0.92 --exclusoes exclusoes.txt --graficos graficos/
+    python -m cesta_pof POF2008.csv POF2018.csv --uf 35 --incremental
+    python -m cesta_pof dados.csv --uf 26 --peso peso_final
+"""
+import argparse
+import os
+import sys
+
+UF_PADRAO = 26
+
+
+def construir_parser():
+    # Os padrões numéricos ficam em cesta_pof.cestas; None aqui significa "usar o padrão"
+    parser = argparse.ArgumentParser(prog='python -m cesta_pof',
+                                     description="Análise da cesta de consumo de uma UF a partir da POF.")
+    parser.add_argument('entrada', nargs='+', help="CSV com os registros de despesa da POF "
+                                                   "(vários arquivos implicam --incremental)")
+    parser.add_argument('--uf', type=int, default=UF_PADRAO, help=f"código da UF (padrão: {UF_PADRAO})")
+    parser.add_argument('--deflator', type=float, help="fator de deflação (padrão: 0.94)")
+    parser.add_argument('--quantil', type=float, help="quantil da linha de pobreza (padrão: 0.35)")
+    parser.add_argument('--multiplicador-mad', type=float, help="multiplicador do MAD no corte de outliers (padrão: 3)")
+    parser.add_argument('--exclusoes', help="arquivo com os subitens excluídos da cesta refinada "
+                                            "(um código por linha; padrão: lista de Mancini)")
+    parser.add_argument('--peso', metavar='COLUNA',
+                        help="pondera as estatísticas pelo fator de expansão nesta coluna do CSV")
+    parser.add_argument('--arquivo-pesos', metavar='CSV',
+                        help="CSV à parte com uf, domicilio e a coluna de --peso (padrão: peso_final)")
+    parser.add_argument('--replicas-bootstrap', type=int, default=0,
+                        help="réplicas de bootstrap para os intervalos de confiança (0 desativa)")
+    parser.add_argument('--semente', type=int, default=None)
+    parser.add_argument('--saida', help="grava o relatório Excel neste arquivo")
+    parser.add_argument('--dir-tabelas', help="grava cada tabela neste diretório")
+    parser.add_argument('--formato-tabelas', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--graficos', metavar='DIR', help="gera os gráficos comparativos (PNG) neste diretório")
+    parser.add_argument('--dir-cache', default='.cache_pof', help="diretório dos caches (padrão: .cache_pof)")
+    parser.add_argument('--sem-cache', action='store_true', help="não usa os caches de leitura e de etapas")
+    parser.add_argument('--incremental', action='store_true',
+                        help="agrega o CSV em blocos, sem manter os registros em memória (arquivos grandes)")
+    parser.add_argument('--relatorio-execucao', help="grava tempos e contagens por etapa (.json ou .csv)")
+    return parser
+
+
+def _parametros(args):
+    from cesta_pof.cestas import CESTAS_PADRAO, carregar_exclusoes
+
+    variantes = dict(CESTAS_PADRAO)
+    if args.exclusoes:
+        variantes['Refinada'] = carregar_exclusoes(args.exclusoes)
+    parametros = {'variantes': variantes, 'replicas_bootstrap': args.replicas_bootstrap, 'semente': args.semente}
+    for nome, valor in (('fator_deflacao', args.deflator), ('quantil', args.quantil),
+                        ('multiplicador_mad', args.multiplicador_mad)):
+        if valor is not None:
+            parametros[nome] = valor
+    return parametros
+
+
+def _imprimir_resumo(resultado):
+    for nome, cesta in resultado.cestas.items():
+        print(f"Cesta {nome}: {len(cesta.df_final)} domicílios, linha de pobreza R$ {cesta.linha_pobreza:.2f}")
+    colunas = ['Linha de pobreza', 'BRL', 'HCR_adj (%)', 'HCR (%)', 'Change from HCR (%)']
+    print(f"\nCesta de referência ({resultado.cesta_referencia}):")
+    print(resultado.tabela_hcr[colunas].to_string(index=False, float_format='{:.2f}'.format))
+
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+
+    from cesta_pof.cache import CacheEtapas
+    from cesta_pof.instrumentacao import Execucao
+    from cesta_pof.pipeline import analisar_arquivo, relatorio_uf
+
+    try:
+        parametros = _parametros(args)
+    except (OSError, ValueError) as erro:
+        print(f"Erro na lista de exclusões: {erro}", file=sys.stderr)
+        return 2
+    if args.arquivo_pesos:
+        from cesta_pof.ingestao import COLUNA_PESO_PADRAO, ler_fator_expansao
+
+        try:
+            parametros['fator_expansao'] = ler_fator_expansao(args.arquivo_pesos, args.peso or COLUNA_PESO_PADRAO,
+                                                              uf=args.uf)
+        except (OSError, ValueError) as erro:
+            print(f"Erro no arquivo de pesos: {erro}", file=sys.stderr)
+            return 2
+    elif args.peso:
+        parametros['fator_expansao'] = args.peso
+
+    incremental = args.incremental or len(args.entrada) > 1
+    entrada = args.entrada if incremental else args.entrada[0]
+    cache = None if args.sem_cache else CacheEtapas(os.path.join(args.dir_cache, 'etapas'))
+    with Execucao(f'uf_{args.uf}') as execucao:
+        try:
+            resultado = analisar_arquivo(entrada, args.uf, cache=cache, incremental=incremental,
+                                         dir_cache=None if args.sem_cache else args.dir_cache, **parametros)
+        except FileNotFoundError as erro:
+            print(f"Arquivo '{erro.filename}' não encontrado.", file=sys.stderr)
+            return 1
+        except ValueError as erro:
+            print(f"{erro}.", file=sys.stderr)
+            return 1
+
+        _imprimir_resumo(resultado)
+        relatorio = relatorio_uf(resultado)
+        if args.saida:
+            try:
+                relatorio.salvar_excel(args.saida)
+                print(f"\nRelatório salvo em '{args.saida}'.")
+            except ImportError:
+                print("\nAVISO: Para salvar em Excel, a biblioteca 'xlsxwriter' ou 'openpyxl' é necessária.")
+                print("Por favor, instale-a usando o comando: pip install xlsxwriter")
+        if args.dir_tabelas:
+            formato = args.formato_tabelas
+            try:
+                relatorio.salvar_tabelas(args.dir_tabelas, formato)
+            except ImportError:
+                print("\nAVISO: Para gravar as tabelas em Parquet, a biblioteca 'pyarrow' é necessária.")
+                print("Por favor, instale-a usando o comando: pip install pyarrow")
+                formato = 'csv'
+                relatorio.salvar_tabelas(args.dir_tabelas, formato)
+            print(f"Tabelas gravadas em '{args.dir_tabelas}' ({formato}).")
+        if args.graficos:
+            from concurrent.futures import ProcessPoolExecutor
+
+            from cesta_pof.graficos import gerar_graficos
+
+            os.makedirs(args.graficos, exist_ok=True)
+            try:
+                # O pool só é encerrado depois que todos os gráficos forem gravados
+                with ProcessPoolExecutor() as pool:
+                    for futuro in gerar_graficos(resultado, args.graficos, pool=pool):
+                        print(f"Gráfico salvo em '{futuro.result()}'.")
+            except ImportError:
+                print("\nAVISO: Para gerar os gráficos, a biblioteca 'matplotlib' é necessária.")
+                print("Por favor, instale-a usando o comando: pip install matplotlib")
+    if args.relatorio_execucao:
+        execucao.salvar(args.relatorio_execucao)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Composição da cesta dos domicílios até a linha de pobreza.
+"""
+import numpy as np
+import pandas as pd
+
+from cesta_pof.ponderado import media_ponderada
+
+COLUNAS_TECNICAS = ['gasto_nominal', 'gasto_real', 'log_gasto_real', 'uf']
+
+
+def composicao_ate_linha(base, df_final, linha_pobreza, excluir=(), pesos=None):
+    """
+    Gasto médio e pesos por grupo e por subitem dos domicílios com gasto_real <= linha.
+
+    base é o AgregadoBase dos registros (cesta_pof.cestas) e df_final o agregado
+    domicílio x grupo da cesta já sem outliers; excluir são os subitens fora da
+    cesta. O gasto médio do subitem é a média dos registros desse subitem nos
+    domicílios pobres. Com `pesos` (fator de expansão alinhado a df_final), as
+    médias são ponderadas. Os pesos são retornados como fração (0-1).
+    """
+    pobre = (df_final['gasto_real'] <= linha_pobreza).to_numpy()
+    df_ate_pobreza = df_final[pobre]
+    grupos = [col for col in df_ate_pobreza.columns if col not in COLUNAS_TECNICAS]
+
+    # Gasto médio por grupo
+    if pesos is None:
+        gasto_medio_grupo = df_ate_pobreza[grupos].mean()
+    else:
+        pesos_pobres = np.asarray(pesos, dtype=float)[pobre]
+        gasto_medio_grupo = pd.Series(media_ponderada(df_ate_pobreza[grupos].to_numpy(dtype=float), pesos_pobres),
+                                      index=grupos)
+    gasto_total_medio = gasto_medio_grupo.sum()
+    peso_grupo = gasto_medio_grupo / gasto_total_medio if gasto_total_medio > 0 else gasto_medio_grupo * 0.0
+    df_composicao_grupo = pd.DataFrame({
+        'Grupo': grupos,
+        'Gasto Médio no Grupo (R$)': gasto_medio_grupo.to_numpy(),
+        'Peso no Total (%)': peso_grupo.to_numpy(),
+    })
+
+    # Subitens de cada grupo, na ordem em que aparecem nos registros
+    subitens = base.subitens[~base.subitens.index.isin(list(excluir))]
+    ordem_grupo = {grupo: i for i, grupo in enumerate(grupos)}
+    subitens = subitens[subitens['nome_grupo'].isin(ordem_grupo)]
+    subitens = subitens.iloc[np.argsort(subitens['nome_grupo'].map(ordem_grupo).to_numpy(), kind='stable')]
+
+    # Uma junção com o conjunto de domicílios pobres e uma agregação por subitem
+    if pesos is None:
+        domicilios_pobres = pd.DataFrame({'domicilio': df_ate_pobreza.index.get_level_values('domicilio').unique()})
+        pobres = base.por_subitem.merge(domicilios_pobres, on='domicilio')
+    else:
+        domicilios_pobres = df_ate_pobreza.index.to_frame(index=False)[['domicilio', 'uf']]
+        domicilios_pobres['peso'] = pesos_pobres
+        pobres = base.por_subitem.merge(domicilios_pobres, on=['domicilio', 'uf'])
+        pobres['gasto'] = pobres['gasto'] * pobres['peso']
+        pobres['n_registros'] = pobres['n_registros'] * pobres['peso']
+    soma = pobres.groupby('cod_subitem')[['gasto', 'n_registros']].sum()
+    gasto_subitem = soma['gasto'] / soma['n_registros']
+
+    gasto = subitens.index.map(gasto_subitem).to_numpy(dtype=float)
+    medio_grupo = subitens['nome_grupo'].map(gasto_medio_grupo).to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        peso_no_grupo = np.where(medio_grupo > 0, gasto / medio_grupo, 0.0)
+    peso_no_total = gasto / gasto_total_medio if gasto_total_medio > 0 else np.zeros_like(gasto)
+
+    df_composicao_subitem = pd.DataFrame({
+        'Grupo': subitens['nome_grupo'].to_numpy(),
+        'Código Subitem': subitens.index.to_numpy(),
+        'Nome Subitem': subitens['subitem'].to_numpy(),
+        'Gasto Médio Subitem (R$)': gasto,
+        'Peso no Grupo (%)': peso_no_grupo,
+        'Peso no Total (%)': peso_no_total,
+    })
+    return df_composicao_grupo, df_composicao_subitem
@@ -0,0 +1,242 @@
+"""
+Gráficos comparativos das cestas.
+
+A preparação dos dados é feita só com NumPy: KDE por binning + convolução via FFT
+no lugar do kdeplot sobre os vetores completos, e ECDF já ordenada e recortada à
+faixa exibida. Com o fator de expansão na cesta, KDE, ECDF e marcadores são
+ponderados como as tabelas. O matplotlib só é importado dentro das funções de
+desenho, que rodam em processos separados; a parte numérica da análise pode
+rodar sem matplotlib nem seaborn instalados.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+DPI_PADRAO = 300
+PONTOS_KDE = 1024
+CORTE_KDE = 3
+
+ARQUIVO_PESOS = 'grafico_comparativo_pesos.png'
+ARQUIVO_DISTRIBUICOES = 'grafico_comparativo_distribuicoes.png'
+ARQUIVO_CUMULATIVO = 'grafico_cumulativo_cesta_refinada.png'
+ROTULOS_PESOS = {'Bruta': 'Peso (Bruto)', 'Refinada': 'Peso (Refinado)'}
+
+
+def kde_binned(valores, pontos=PONTOS_KDE, corte=CORTE_KDE, pesos=None):
+    """
+    Densidade gaussiana (banda de Scott, como o kdeplot) estimada em uma grade.
+
+    Os valores são agregados em `pontos` caixas com interpolação linear e o
+    histograma é convoluído com o núcleo via FFT: O(n + m log m) em vez de O(n m).
+    Com `pesos`, cada valor entra nas caixas com o seu peso e a banda usa o
+    desvio padrão ponderado e o tamanho efetivo da amostra (como o
+    scipy.stats.gaussian_kde). Retorna (grade, densidade).
+    """
+    valores = np.asarray(valores, dtype=float)
+    n = len(valores)
+    if n < 2 or np.std(valores) == 0:
+        return np.array([]), np.array([])
+    if pesos is None:
+        pesos = np.full(n, 1.0 / n)
+        banda = np.std(valores, ddof=1) * n ** (-1 / 5)
+    else:
+        pesos = np.asarray(pesos, dtype=float) / np.sum(pesos)
+        n_efetivo = 1 / np.sum(pesos ** 2)
+        media = pesos @ valores
+        variancia = pesos @ (valores - media) ** 2 / (1 - np.sum(pesos ** 2))
+        banda = np.sqrt(variancia) * n_efetivo ** (-1 / 5)
+    inicio = valores.min() - corte * banda
+    fim = valores.max() + corte * banda
+    grade, passo = np.linspace(inicio, fim, pontos, retstep=True)
+
+    # Binning linear: cada valor é dividido entre as duas caixas vizinhas
+    posicao = (valores - inicio) / passo
+    esquerda = np.clip(np.floor(posicao).astype(np.int64), 0, pontos - 2)
+    peso_direita = posicao - esquerda
+    contagens = np.bincount(esquerda, weights=pesos * (1 - peso_direita), minlength=pontos)
+    contagens += np.bincount(esquerda + 1, weights=pesos * peso_direita, minlength=pontos)
+
+    # Convolução com o núcleo gaussiano (preenchimento com zeros evita o efeito circular)
+    alcance = min(pontos - 1, int(np.ceil(corte * 2 * banda / passo)))
+    deslocamentos = np.arange(-alcance, alcance + 1) * passo
+    nucleo = np.exp(-0.5 * (deslocamentos / banda) ** 2) / (banda * np.sqrt(2 * np.pi))
+    tamanho = pontos + len(nucleo) - 1
+    tamanho_fft = 1 << (tamanho - 1).bit_length()
+    convolucao = np.fft.irfft(np.fft.rfft(contagens, tamanho_fft) * np.fft.rfft(nucleo, tamanho_fft), tamanho_fft)
+    densidade = np.maximum(convolucao[alcance:alcance + pontos], 0)
+    return grade, densidade
+
+
+def ordenar_acumulado(valores, pesos=None):
+    """(valores em ordem crescente, proporção acumulada em cada um), ponderada se houver pesos."""
+    valores = np.asarray(valores, dtype=float)
+    if pesos is None:
+        return np.sort(valores), np.arange(1, len(valores) + 1) / len(valores)
+    ordem = np.argsort(valores, kind='stable')
+    acumulado = np.cumsum(np.asarray(pesos, dtype=float)[ordem])
+    return valores[ordem], acumulado / acumulado[-1]
+
+
+def proporcao_ate(ordenados, acumulado, limite):
+    """Proporção acumulada dos valores <= limite (a altura da ECDF no ponto)."""
+    k = np.searchsorted(ordenados, limite, side='right')
+    return acumulado[k - 1] if k else 0.0
+
+
+def ecdf_faixa(ordenados, inicio, fim, acumulado=None):
+    """
+    Pontos (x, proporção acumulada) da ECDF de um vetor ordenado, só na faixa
+    [inicio, fim] e vizinhos. acumulado vem de ordenar_acumulado (padrão: sem pesos).
+    """
+    n = len(ordenados)
+    i0 = max(np.searchsorted(ordenados, inicio, side='left') - 1, 0)
+    i1 = min(np.searchsorted(ordenados, fim, side='right') + 1, n)
+    if acumulado is None:
+        return ordenados[i0:i1], np.arange(i0 + 1, i1 + 1) / n
+    return ordenados[i0:i1], acumulado[i0:i1]
+
+
+def _fator(cesta):
+    # Fator de expansão alinhado a df_final (None sem pesos)
+    return None if cesta.fator_expansao is None else cesta.fator_expansao.to_numpy(dtype=float)
+
+
+def dados_graficos(resultado, cesta_a='Bruta', cesta_b='Refinada'):
+    """Prepara (só com NumPy) os dados leves dos três gráficos a partir de um ResultadoUF."""
+    a = resultado.cestas[cesta_a]
+    b = resultado.cestas[cesta_b]
+    referencia = resultado.referencia
+    linha = referencia.linha_pobreza
+
+    pesos = pd.concat([
+        (a.pesos * 100).rename(ROTULOS_PESOS.get(cesta_a, f'Peso ({cesta_a})')),
+        (b.pesos * 100).rename(ROTULOS_PESOS.get(cesta_b, f'Peso ({cesta_b})')),
+    ], axis=1)
+    pesos = pesos.sort_values(by=pesos.columns[1])
+
+    distribuicoes = {
+        'curvas': [
+            (f'Distribuição {cesta_a}', *kde_binned(a.df_final['gasto_real'].to_numpy(), pesos=_fator(a))),
+            (f'Distribuição {cesta_b}', *kde_binned(b.df_final['gasto_real'].to_numpy(), pesos=_fator(b))),
+        ],
+        'linhas': [
+            (a.linha_pobreza, 'blue', f'Linha Pobreza {cesta_a} (R${a.linha_pobreza:.2f})'),
+            (b.linha_pobreza, 'red', f'Linha Pobreza {cesta_b} (R${b.linha_pobreza:.2f})'),
+        ],
+    }
+
+    faixa = resultado.tabela_faixa
+    limite_inferior = faixa['Valor (R$)'].iloc[0]
+    limite_superior = faixa['Valor (R$)'].iloc[-1]
+    # Mesma ponderação de tabela_faixa, de onde vêm os marcadores
+    fator = _fator(referencia)
+    real, acumulado_real = ordenar_acumulado(referencia.df_final['gasto_real'].to_numpy(), fator)
+    nominal, acumulado_nominal = ordenar_acumulado(referencia.df_final['gasto_nominal'].to_numpy(), fator)
+    cumulativo = {
+        'real': ecdf_faixa(real, limite_inferior, limite_superior, acumulado_real),
+        'nominal': ecdf_faixa(nominal, limite_inferior, limite_superior, acumulado_nominal),
+        'linha': linha,
+        'limites': (limite_inferior, limite_superior),
+        'ylim': (proporcao_ate(real, acumulado_real, limite_inferior),
+                 proporcao_ate(real, acumulado_real, limite_superior)),
+        'marcadores': faixa.iloc[:, :3].to_numpy() / [1, 100, 100],
+        'cesta': cesta_b,
+    }
+    return {'pesos': pesos, 'distribuicoes': distribuicoes, 'cumulativo': cumulativo}
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def grafico_pesos(pesos, caminho, dpi=DPI_PADRAO):
+    """Gráfico 1: comparação dos pesos dos grupos nas duas cestas."""
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(12, 8))
+    pesos.plot(kind='barh', ax=ax)
+    ax.set_title('Comparação dos Pesos na Cesta de Consumo (Bruta vs. Refinada)')
+    ax.set_xlabel('Peso Relativo (%)')
+    fig.savefig(caminho, bbox_inches='tight', dpi=dpi)
+    plt.close(fig)
+    return caminho
+
+
+def grafico_distribuicoes(distribuicoes, caminho, dpi=DPI_PADRAO):
+    """Gráfico 2: densidades do gasto real das duas cestas, com as linhas de pobreza."""
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(12, 7))
+    for rotulo, grade, densidade in distribuicoes['curvas']:
+        linha, = ax.plot(grade, densidade, label=rotulo)
+        ax.fill_between(grade, densidade, alpha=0.25, color=linha.get_color())
+    for valor, cor, rotulo in distribuicoes['linhas']:
+        ax.axvline(valor, color=cor, linestyle='--', label=rotulo)
+    ax.set_ylim(bottom=0)
+    ax.set_title('Comparação das Distribuições de Gasto Real')
+    ax.set_xlabel('Gasto Real por Domicílio (R$)')
+    ax.set_ylabel('Density')
+    ax.legend()
+    fig.savefig(caminho, bbox_inches='tight', dpi=dpi)
+    plt.close(fig)
+    return caminho
+
+
+def grafico_cumulativo(cumulativo, caminho, dpi=DPI_PADRAO):
+    """Gráfico 3: distribuição cumulativa real vs nominal na faixa de +-20% da linha."""
+    plt = _pyplot()
+    linha = cumulativo['linha']
+    limite_inferior, limite_superior = cumulativo['limites']
+    fig, ax = plt.subplots(figsize=(12, 7))
+    ax.plot(*cumulativo['real'], label='Gasto Real (Deflacionado)', color='green')
+    ax.plot(*cumulativo['nominal'], label='Gasto Nominal', color='orange')
+    ax.axvline(linha, color='red', linestyle='--', linewidth=2, label=f'Linha de Pobreza (R$ {linha:.2f})')
+    ax.axvspan(limite_inferior, limite_superior, color='gray', alpha=0.2, label='±20% em torno da Pobreza')
+
+    # Marcadores de cada série em uma única chamada; os rótulos continuam um por ponto
+    valores, prop_real, prop_nominal = cumulativo['marcadores'].T
+    ax.plot(valores, prop_real, 'o', color='green', linestyle='none')
+    ax.plot(valores, prop_nominal, 's', color='orange', linestyle='none')
+    for valor, real, nominal in cumulativo['marcadores']:
+        ax.text(valor, real + 0.01, f'R${valor:.2f}', color='green', fontsize=8, ha='center', va='bottom')
+        ax.text(valor, nominal - 0.01, f'R${valor:.2f}', color='orange', fontsize=8, ha='center', va='top')
+
+    ax.set_xlim(limite_inferior, limite_superior)
+    ax.set_ylim(*cumulativo['ylim'])
+    ax.set_xlabel('Gasto por Domicílio (R$)')
+    ax.set_ylabel('Proporção acumulada da população')
+    ax.set_title(f"Distribuição Cumulativa - Cesta {cumulativo['cesta']}\n"
+                 f"({len(valores)} pontos da faixa ±20% da linha de pobreza)")
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(caminho, bbox_inches='tight', dpi=dpi)
+    plt.close(fig)
+    return caminho
+
+
+def gerar_graficos(resultado, diretorio='', dpi=DPI_PADRAO, processos=None, pool=None):
+    """
+    Dispara o desenho dos três gráficos em processos separados.
+
+    Retorna uma lista de futures (cada uma resolve para o caminho do PNG). Para
+    desenhar em segundo plano, quem chama informa o pool e é dono dele (um
+    `with ProcessPoolExecutor() as pool:` que dure até as futures serem lidas).
+    Sem pool, um ProcessPoolExecutor próprio é criado e encerrado aqui, depois
+    que os três gráficos terminarem.
+    """
+    dados = dados_graficos(resultado)
+    tarefas = [
+        (grafico_pesos, dados['pesos'], os.path.join(diretorio, ARQUIVO_PESOS)),
+        (grafico_distribuicoes, dados['distribuicoes'], os.path.join(diretorio, ARQUIVO_DISTRIBUICOES)),
+        (grafico_cumulativo, dados['cumulativo'], os.path.join(diretorio, ARQUIVO_CUMULATIVO)),
+    ]
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=processos or len(tarefas)) as pool:
+            futuros = [pool.submit(funcao, dado, caminho, dpi) for funcao, dado, caminho in tarefas]
+            wait(futuros)
+        return futuros
+    return [pool.submit(funcao, dado, caminho, dpi) for funcao, dado, caminho in tarefas]
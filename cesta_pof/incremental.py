@@ -0,0 +1,174 @@
+"""
+Agregação incremental (fora da memória) para arquivos nacionais e de vários anos.
+
+Os CSVs são lidos em blocos; cada bloco é classificado e reduzido às somas por
+domicílio x grupo e domicílio x subitem, que são acumuladas. Só o agregado no
+nível do domicílio fica em memória: o pico passa a depender do número de
+domicílios (e de pares domicílio x subitem), não do número de registros de
+despesa. O resultado é um AgregadoBase igual ao de agregar_base sobre os
+registros completos, pronto para analisar_base (corte de MAD, quantis etc.).
+
+As somas parciais são combinadas em outra ordem que a da soma direta, então os
+gastos podem diferir do caminho em memória no último dígito de ponto flutuante.
+"""
+import numpy as np
+import pandas as pd
+
+from cesta_pof.cestas import AgregadoBase
+from cesta_pof.classificacao import GRUPO_PADRAO, classificar
+from cesta_pof.ingestao import TAMANHO_BLOCO_PADRAO, ler_blocos
+from cesta_pof.instrumentacao import etapa
+
+# Linhas de somas parciais acumuladas antes de recombiná-las com o agregado
+LINHAS_COMPACTACAO = 1_000_000
+
+_CHAVE_GRUPO = ['domicilio', 'uf', 'grupo']
+_CHAVE_SUBITEM = ['cod_subitem', 'domicilio', 'uf']
+
+
+def _somar(df, chaves):
+    return df.groupby(chaves, sort=False)['gasto'].agg(['sum', 'count'])
+
+
+def _recombinar(partes):
+    if len(partes) == 1:
+        return partes[0]
+    return pd.concat(partes).groupby(level=list(range(partes[0].index.nlevels)), sort=False).sum()
+
+
+class AgregadorIncremental:
+    """Acumula blocos de registros de despesa no agregado domicílio x grupo e x subitem."""
+
+    def __init__(self, esquema=None, grupo_padrao=GRUPO_PADRAO, linhas_compactacao=LINHAS_COMPACTACAO):
+        # Sem esquema, classificar usa a tabela padrão já compilada
+        self.esquema = esquema
+        self.grupo_padrao = grupo_padrao
+        self.linhas_compactacao = linhas_compactacao
+        self.registros = 0
+        self._categorias = None
+        self._grupos = []
+        self._subitens = []
+        self._pendentes = 0
+        # cod_subitem -> (subitem, código do grupo), na ordem de aparição
+        self._nomes = {}
+
+    def adicionar(self, bloco):
+        """Classifica e acumula um bloco com as colunas de COLUNAS_POF."""
+        if bloco.empty:
+            return
+        grupos = classificar(bloco['cod_subitem'], self.esquema, self.grupo_padrao)
+        self._categorias = list(grupos.categories)
+        bloco = bloco.assign(grupo=grupos.codes)
+
+        self._grupos.append(_somar(bloco, _CHAVE_GRUPO))
+        self._subitens.append(_somar(bloco, _CHAVE_SUBITEM))
+        primeiros = bloco.drop_duplicates('cod_subitem')
+        primeiros = primeiros[~primeiros['cod_subitem'].isin(list(self._nomes))]
+        for codigo, subitem, grupo in zip(primeiros['cod_subitem'], primeiros['subitem'], primeiros['grupo']):
+            self._nomes[int(codigo)] = (str(subitem), int(grupo))
+
+        self.registros += len(bloco)
+        self._pendentes += len(self._grupos[-1]) + len(self._subitens[-1])
+        if self._pendentes > self.linhas_compactacao:
+            self.compactar()
+
+    def compactar(self):
+        """Recombina as somas parciais em uma só (limita a memória ao nível do domicílio)."""
+        if self._grupos:
+            self._grupos = [_recombinar(self._grupos)]
+            self._subitens = [_recombinar(self._subitens)]
+        self._pendentes = 0
+
+    def resultado(self):
+        """
+        AgregadoBase equivalente ao de agregar_base sobre todos os registros acumulados.
+
+        Consome as somas acumuladas (o agregador não deve ser reaproveitado depois).
+        """
+        self.compactar()
+        if not self._grupos:
+            raise ValueError("Nenhum registro acumulado")
+        nomes_grupo = np.asarray(self._categorias, dtype=object)
+
+        por_grupo_longo = self._grupos.pop().sort_index()
+        por_grupo = por_grupo_longo['sum'].unstack(fill_value=0)
+        contagem_grupo = por_grupo_longo['count'].unstack(fill_value=0).astype('int32')
+        del por_grupo_longo
+        for df in (por_grupo, contagem_grupo):
+            df.columns = pd.Index(nomes_grupo[df.columns.to_numpy()].astype(str), name='nome_grupo')
+            df.index.names = ['domicilio', 'uf']
+
+        # Ordenação por (cod_subitem, domicilio, uf) direto nos níveis, sem copiar o MultiIndex
+        somas = self._subitens.pop()
+        niveis = [somas.index.get_level_values(i).to_numpy() for i in range(3)]
+        ordem = np.lexsort(niveis[::-1])
+        por_subitem = pd.DataFrame({nome: nivel[ordem] for nome, nivel in zip(_CHAVE_SUBITEM, niveis)})
+        del niveis
+        por_subitem['gasto'] = somas['sum'].to_numpy()[ordem]
+        por_subitem['n_registros'] = somas['count'].to_numpy()[ordem].astype('int32')
+        del somas, ordem
+
+        codigos = np.fromiter(self._nomes, dtype=np.int32, count=len(self._nomes))
+        subitens = pd.DataFrame({
+            'subitem': [nome for nome, _ in self._nomes.values()],
+            'nome_grupo': nomes_grupo[[grupo for _, grupo in self._nomes.values()]].astype(str),
+        }, index=pd.Index(codigos, name='cod_subitem'))
+        totais = por_subitem.groupby('cod_subitem')[['gasto', 'n_registros']].sum()
+        subitens['gasto'] = totais['gasto']
+        subitens['n_registros'] = totais['n_registros'].astype('int64')
+
+        return AgregadoBase(por_grupo, contagem_grupo, por_subitem, subitens)
+
+
+def lista_caminhos(caminhos):
+    """Um caminho ou uma sequência de caminhos, sempre como lista."""
+    return [caminhos] if isinstance(caminhos, (str, bytes)) or hasattr(caminhos, '__fspath__') else list(caminhos)
+
+
+def agregar_arquivos(caminhos, uf=None, esquema=None, tamanho_bloco=TAMANHO_BLOCO_PADRAO):
+    """
+    Agregado base de uma UF (ou de todas, com uf=None) lendo um ou mais CSVs em blocos.
+
+    Os arquivos são tratados como um só conjunto de registros: os domicílios são
+    identificados por (domicilio, uf), como em agregar_base. Levanta ValueError
+    se não houver registros.
+    """
+    caminhos = lista_caminhos(caminhos)
+    agregador = AgregadorIncremental(esquema)
+    with etapa('agregacao_incremental', arquivos=len(caminhos)) as registro:
+        for caminho in caminhos:
+            for bloco in ler_blocos(caminho, tamanho_bloco):
+                if uf is not None:
+                    bloco = bloco[bloco['uf'] == uf]
+                agregador.adicionar(bloco)
+        registro['linhas_entrada'] = agregador.registros
+        if not agregador.registros:
+            alvo = 'registro' if uf is None else f'registro da UF {uf}'
+            raise ValueError(f"Nenhum {alvo} em {', '.join(map(repr, caminhos))}")
+        base = agregador.resultado()
+        registro['linhas_saida'] = len(base.por_grupo)
+    return base
+
+
+def agregar_por_uf(caminhos, ufs=None, esquema=None, tamanho_bloco=TAMANHO_BLOCO_PADRAO):
+    """
+    Agregado base de cada UF em uma única passada pelos CSVs: {uf: AgregadoBase}.
+
+    Com `ufs`, só as UFs indicadas são acumuladas.
+    """
+    caminhos = lista_caminhos(caminhos)
+    agregadores = {}
+    with etapa('agregacao_incremental', arquivos=len(caminhos)) as registro:
+        for caminho in caminhos:
+            for bloco in ler_blocos(caminho, tamanho_bloco):
+                if ufs is not None:
+                    bloco = bloco[bloco['uf'].isin(ufs)]
+                for valor_uf, parte in bloco.groupby('uf', sort=False):
+                    uf = int(valor_uf)
+                    if uf not in agregadores:
+                        agregadores[uf] = AgregadorIncremental(esquema)
+                    agregadores[uf].adicionar(parte)
+        registro['linhas_entrada'] = sum(a.registros for a in agregadores.values())
+        bases = {uf: agregadores.pop(uf).resultado() for uf in sorted(agregadores)}
+        registro['linhas_saida'] = sum(len(b.por_grupo) for b in bases.values())
+    return bases
@@ -0,0 +1,138 @@
+"""
+Indicadores de pobreza e desigualdade em uma única passada sobre o gasto ordenado.
+
+Com o vetor ordenado e as somas acumuladas de y, y² e log(y), a família FGT
+(P0, P1, P2) e o índice de Watts de qualquer número de linhas saem de um
+np.searchsorted e de algumas operações vetoriais. Gini e Theil vêm das mesmas
+somas. Os domicílios com gasto igual à linha contam como pobres, como no HCR.
+Com pesos (fator de expansão), as somas são ponderadas e as proporções passam a
+ser parcelas do peso total.
+"""
+import numpy as np
+import pandas as pd
+
+
+def somas_prefixo(ordenados, pesos=None):
+    """
+    Somas acumuladas de w, w·y, w·y² e w·log(y) com um zero à esquerda (tamanho n + 1).
+
+    Sem pesos, w = 1 e a primeira soma é a contagem.
+    """
+    with np.errstate(divide='ignore'):
+        log = np.log(ordenados)
+    if pesos is None:
+        termos = (np.ones(len(ordenados)), ordenados, ordenados * ordenados, log)
+    else:
+        pesos = np.asarray(pesos, dtype=float)
+        with np.errstate(invalid='ignore'):
+            # Peso zero anula o termo mesmo com log(0) = -inf
+            termo_log = np.where(pesos > 0, pesos * log, 0.0)
+        termos = (pesos, pesos * ordenados, pesos * ordenados * ordenados, termo_log)
+    somas = []
+    for termo in termos:
+        acumulado = np.zeros(len(ordenados) + 1)
+        np.cumsum(termo, out=acumulado[1:])
+        somas.append(acumulado)
+    return tuple(somas)
+
+
+def fgt_intervalo(ordenados, somas, linhas, inicio=0, fim=None):
+    """
+    P0, P1, P2 e Watts do trecho ordenados[inicio:fim] para cada linha.
+
+    `somas` vem de somas_prefixo(ordenados, pesos); o trecho permite avaliar
+    cortes de outliers (um intervalo contíguo do vetor ordenado) sem recalcular
+    as somas. Watts é infinito se algum domicílio pobre tiver gasto zero.
+    """
+    if fim is None:
+        fim = len(ordenados)
+    sw, s1, s2, slog = somas
+    linhas = np.asarray(linhas, dtype=float)
+    if fim - inicio <= 0 or sw[fim] - sw[inicio] <= 0:
+        vazio = np.full(linhas.shape, np.nan)
+        return vazio, vazio.copy(), vazio.copy(), vazio.copy()
+
+    fim_pobres = inicio + np.searchsorted(ordenados[inicio:fim], linhas, side='right')
+    # Com pesos, k e n são somas de peso em vez de contagens
+    n = sw[fim] - sw[inicio]
+    k = sw[fim_pobres] - sw[inicio]
+    soma_y = s1[fim_pobres] - s1[inicio]
+    soma_y2 = s2[fim_pobres] - s2[inicio]
+    soma_log = slog[fim_pobres] - slog[inicio]
+
+    p0 = k / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p1 = (k * linhas - soma_y) / (n * linhas)
+        p2 = (k * linhas ** 2 - 2 * linhas * soma_y + soma_y2) / (n * linhas ** 2)
+        watts = np.where(k > 0, (k * np.log(linhas) - soma_log) / n, 0.0)
+    return p0, p1, np.maximum(p2, 0.0), watts
+
+
+def gini_theil(ordenados, somas=None, pesos=None):
+    """Índices de Gini e de Theil (T) de um vetor já ordenado (pesos na mesma ordem)."""
+    n = len(ordenados)
+    if not n:
+        return np.nan, np.nan
+    if pesos is not None:
+        return _gini_theil_ponderados(ordenados, np.asarray(pesos, dtype=float))
+    total = ordenados.sum() if somas is None else somas[1][-1]
+    if total <= 0:
+        return np.nan, np.nan
+    posicoes = np.arange(1, n + 1)
+    gini = 2 * np.dot(posicoes, ordenados) / (n * total) - (n + 1) / n
+    relativo = ordenados / (total / n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        theil = np.where(relativo > 0, relativo * np.log(relativo), 0.0).mean()
+    return gini, theil
+
+
+def _gini_theil_ponderados(ordenados, pesos):
+    peso_total = pesos.sum()
+    acumulado = np.cumsum(pesos * ordenados)
+    total = acumulado[-1] if len(acumulado) else 0.0
+    if peso_total <= 0 or total <= 0:
+        return np.nan, np.nan
+    # Área sob a curva de Lorenz por trapézios, um por observação
+    anterior = acumulado - pesos * ordenados
+    gini = 1 - np.dot(pesos, anterior + acumulado) / (peso_total * total)
+    relativo = ordenados / (total / peso_total)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        theil = np.dot(pesos, np.where(relativo > 0, relativo * np.log(relativo), 0.0)) / peso_total
+    return gini, theil
+
+
+def indicadores(valores, linhas, ordenado=False, pesos=None):
+    """
+    FGT (P0, P1, P2), Watts, Gini e Theil de `valores` para cada linha de pobreza.
+
+    Com `pesos` (alinhados a `valores`), todos os indicadores são ponderados.
+    Retorna um DataFrame com uma linha por linha de pobreza; Gini e Theil não
+    dependem da linha e se repetem.
+    """
+    valores = np.asarray(valores, dtype=float)
+    if ordenado:
+        ordenados = valores
+    elif pesos is None:
+        ordenados = np.sort(valores)
+    else:
+        ordem = np.argsort(valores, kind='stable')
+        ordenados, pesos = valores[ordem], np.asarray(pesos, dtype=float)[ordem]
+    somas = somas_prefixo(ordenados, pesos)
+    p0, p1, p2, watts = fgt_intervalo(ordenados, somas, linhas)
+    gini, theil = gini_theil(ordenados, somas, pesos)
+    return pd.DataFrame({
+        'linha': np.asarray(linhas, dtype=float),
+        'P0': p0,
+        'P1': p1,
+        'P2': p2,
+        'Watts': watts,
+        'Gini': gini,
+        'Theil': theil,
+    })
+
+
+def indicadores_real_nominal(df_final, linhas, pesos=None):
+    """Indicadores do gasto real e do nominal nas mesmas linhas, lado a lado (sufixos _adj e nominal)."""
+    real = indicadores(df_final['gasto_real'].to_numpy(), linhas, pesos=pesos)
+    nominal = indicadores(df_final['gasto_nominal'].to_numpy(), linhas, pesos=pesos)
+    return real.join(nominal.drop(columns='linha'), lsuffix='_adj')
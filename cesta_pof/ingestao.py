@@ -0,0 +1,219 @@
+"""
+Ingestão dos registros de despesa da POF.
+
+Lê do CSV apenas as colunas usadas na análise, com tipos compactos, filtrando a
+UF bloco a bloco. Na primeira leitura grava um cache Parquet particionado por UF
+(identificado pelo hash do CSV); as execuções seguintes leem só a partição da UF.
+O hash de cada CSV fica guardado junto com o tamanho e a data de modificação do
+arquivo, e só é recalculado quando eles mudam.
+"""
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+COLUNAS_POF = ['uf', 'domicilio', 'cod_subitem', 'subitem', 'gasto']
+
+# Tipos usados na leitura do CSV. 'subitem' é lido como texto e convertido para
+# categoria no final, já que cada bloco teria categorias diferentes.
+TIPOS_LEITURA = {
+    'uf': 'int8',
+    'domicilio': 'int64',
+    'cod_subitem': 'int32',
+    'subitem': 'str',
+    'gasto': 'float64',
+}
+
+# Coluna com o fator de expansão (peso amostral) do domicílio, quando o CSV a traz
+COLUNA_PESO_PADRAO = 'peso_final'
+
+DIR_CACHE_PADRAO = '.cache_pof'
+TAMANHO_BLOCO_PADRAO = 1_000_000
+_MARCADOR_COMPLETO = '_COMPLETO'
+
+
+def assinatura_arquivo(caminho):
+    """(mtime_ns, tamanho) do arquivo: muda sempre que o arquivo é regravado."""
+    info = os.stat(caminho)
+    return info.st_mtime_ns, info.st_size
+
+
+def _sha256(caminho, tamanho_leitura):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_leitura), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def hash_arquivo(caminho, tamanho_leitura=1 << 20, dir_cache=DIR_CACHE_PADRAO):
+    """
+    Retorna o SHA-256 (hex) do conteúdo do arquivo.
+
+    Com dir_cache, o hash é guardado com a assinatura do arquivo (mtime_ns e
+    tamanho) e reaproveitado enquanto ela não mudar, sem reler o CSV.
+    """
+    if dir_cache is None:
+        return _sha256(caminho, tamanho_leitura)
+    assinatura = list(assinatura_arquivo(caminho))
+    nome = hashlib.sha256(os.path.abspath(caminho).encode('utf-8')).hexdigest()
+    registro = os.path.join(dir_cache, 'assinaturas', f'{nome}.json')
+    try:
+        with open(registro, encoding='utf-8') as f:
+            guardado = json.load(f)
+        if guardado['assinatura'] == assinatura:
+            return guardado['sha256']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    digest = _sha256(caminho, tamanho_leitura)
+    os.makedirs(os.path.dirname(registro), exist_ok=True)
+    temporario = f'{registro}.{os.getpid()}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump({'caminho': os.path.abspath(caminho), 'assinatura': assinatura, 'sha256': digest}, f)
+    os.replace(temporario, registro)
+    return digest
+
+
+def _vazio():
+    return pd.DataFrame({c: pd.Series(dtype=t) for c, t in TIPOS_LEITURA.items()})
+
+
+def _finalizar(df):
+    # Tipos compactos finais, com 'subitem' categórico
+    df = df.reset_index(drop=True)
+    df['subitem'] = df['subitem'].astype('category')
+    return df
+
+
+def ler_blocos(caminho, tamanho_bloco=TAMANHO_BLOCO_PADRAO):
+    """Itera sobre o CSV em blocos de `tamanho_bloco` linhas, só com as colunas usadas."""
+    return pd.read_csv(caminho, usecols=COLUNAS_POF, dtype=TIPOS_LEITURA, chunksize=tamanho_bloco)
+
+
+def fator_expansao_de(df, coluna=COLUNA_PESO_PADRAO):
+    """
+    Fator de expansão por domicílio a partir de uma tabela com uf, domicilio e a coluna de peso.
+
+    Retorna uma Series indexada por (domicilio, uf). Levanta ValueError se o
+    mesmo domicílio aparecer com pesos diferentes.
+    """
+    pesos = df[['domicilio', 'uf', coluna]].drop_duplicates()
+    if pesos[coluna].isna().any():
+        raise ValueError(f"Coluna '{coluna}' com valores ausentes")
+    repetidos = pesos.duplicated(['domicilio', 'uf'])
+    if repetidos.any():
+        raise ValueError(f"{int(repetidos.sum())} domicílios com mais de um valor em '{coluna}'")
+    return pesos.set_index(['domicilio', 'uf'])[coluna].astype('float64').rename('fator_expansao')
+
+
+def ler_fator_expansao(caminho, coluna=COLUNA_PESO_PADRAO, uf=None, tamanho_bloco=TAMANHO_BLOCO_PADRAO):
+    """
+    Lê o fator de expansão de cada domicílio de um CSV (o próprio arquivo de
+    despesas ou um arquivo à parte com uf, domicilio e a coluna de peso).
+    """
+    try:
+        blocos = pd.read_csv(caminho, usecols=['uf', 'domicilio', coluna], chunksize=tamanho_bloco,
+                             dtype={'uf': TIPOS_LEITURA['uf'], 'domicilio': TIPOS_LEITURA['domicilio'],
+                                    coluna: 'float64'})
+        partes = []
+        for bloco in blocos:
+            if uf is not None:
+                bloco = bloco[bloco['uf'] == uf]
+            partes.append(bloco.drop_duplicates())
+    except ValueError as erro:
+        if coluna in str(erro):
+            raise ValueError(f"Coluna '{coluna}' (fator de expansão) não encontrada em '{caminho}'") from None
+        raise
+    return fator_expansao_de(pd.concat(partes, ignore_index=True), coluna)
+
+
+def _ler_csv_filtrando(caminho, uf, tamanho_bloco):
+    # Leitura em blocos sem cache: mantém em memória só as linhas da UF pedida
+    partes = []
+    for bloco in ler_blocos(caminho, tamanho_bloco):
+        if uf is not None:
+            bloco = bloco[bloco['uf'] == uf]
+        if len(bloco):
+            partes.append(bloco)
+    if not partes:
+        return _finalizar(_vazio())
+    return _finalizar(pd.concat(partes, ignore_index=True))
+
+
+def _construir_cache(caminho, dir_destino, uf, tamanho_bloco):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([
+        ('domicilio', pa.int64()),
+        ('cod_subitem', pa.int32()),
+        ('subitem', pa.string()),
+        ('gasto', pa.float64()),
+    ])
+    escritores = {}
+    partes = []
+    try:
+        for bloco in ler_blocos(caminho, tamanho_bloco):
+            for valor_uf, parte in bloco.groupby('uf', sort=False):
+                if valor_uf not in escritores:
+                    dir_uf = os.path.join(dir_destino, f'uf={int(valor_uf)}')
+                    os.makedirs(dir_uf, exist_ok=True)
+                    escritores[valor_uf] = pq.ParquetWriter(os.path.join(dir_uf, 'parte.parquet'), esquema)
+                tabela = pa.Table.from_pandas(parte.drop(columns='uf'), schema=esquema, preserve_index=False)
+                escritores[valor_uf].write_table(tabela)
+                if uf is None or valor_uf == uf:
+                    partes.append(parte)
+    finally:
+        for escritor in escritores.values():
+            escritor.close()
+
+    # Só marca o cache como válido depois que todas as partições foram fechadas
+    open(os.path.join(dir_destino, _MARCADOR_COMPLETO), 'w').close()
+
+    if not partes:
+        return _finalizar(_vazio())
+    return _finalizar(pd.concat(partes, ignore_index=True))
+
+
+def _ler_particao(dir_cache_csv, uf):
+    dir_uf = os.path.join(dir_cache_csv, f'uf={int(uf)}')
+    if not os.path.isdir(dir_uf):
+        return None
+    df = pd.read_parquet(dir_uf)
+    df.insert(0, 'uf', pd.Series(uf, index=df.index, dtype=TIPOS_LEITURA['uf']))
+    return df[COLUNAS_POF]
+
+
+def ufs_em_cache(dir_cache_csv):
+    """Lista as UFs presentes em um cache já construído."""
+    return sorted(int(nome.split('=', 1)[1]) for nome in os.listdir(dir_cache_csv) if nome.startswith('uf='))
+
+
+def carregar_pof(caminho, uf=None, dir_cache=DIR_CACHE_PADRAO, tamanho_bloco=TAMANHO_BLOCO_PADRAO):
+    """
+    Carrega os registros de despesa da POF de uma UF (ou de todas, com uf=None).
+
+    Com dir_cache=None a leitura é feita sempre direto do CSV, em blocos.
+    """
+    if dir_cache is None:
+        return _ler_csv_filtrando(caminho, uf, tamanho_bloco)
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("\nAVISO: Para usar o cache Parquet, a biblioteca 'pyarrow' é necessária.")
+        print("Por favor, instale-a usando o comando: pip install pyarrow")
+        return _ler_csv_filtrando(caminho, uf, tamanho_bloco)
+
+    dir_cache_csv = os.path.join(dir_cache, hash_arquivo(caminho, dir_cache=dir_cache))
+    if os.path.exists(os.path.join(dir_cache_csv, _MARCADOR_COMPLETO)):
+        ufs = ufs_em_cache(dir_cache_csv) if uf is None else [uf]
+        partes = [p for p in (_ler_particao(dir_cache_csv, u) for u in ufs) if p is not None]
+        if not partes:
+            return _finalizar(_vazio())
+        return _finalizar(pd.concat(partes, ignore_index=True))
+
+    os.makedirs(dir_cache_csv, exist_ok=True)
+    return _construir_cache(caminho, dir_cache_csv, uf, tamanho_bloco)
@@ -0,0 +1,201 @@
+"""
+Instrumentação das etapas da análise.
+
+Uma Execucao ativa registra cada bloco `with etapa(...)`: tempo de parede, tempo
+de CPU, pico de memória alocada (tracemalloc, opcional), pico de RSS do processo
+e as contagens de linhas informadas pela etapa (entrada, saída, descartes).
+As etapas podem ser aninhadas. Sem Execucao ativa, `etapa` não mede nada e
+custa apenas a criação de um dicionário, então as funções da biblioteca podem
+ser instrumentadas sem custo para quem não pede o relatório.
+
+O relatório sai em JSON ou CSV; opcionalmente toda a execução é perfilada com
+cProfile e gravada em um arquivo .prof (pstats, snakeviz etc.).
+
+Uso:
+    with Execucao(memoria=True, perfil='execucao.prof') as execucao:
+        with etapa('ingestao') as registro:
+            df = carregar_pof(...)
+            registro['linhas_saida'] = len(df)
+    execucao.salvar('execucao.json')
+"""
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+_ATIVA = None
+
+
+def rss_max_mb():
+    """Pico de RSS do processo desde o início, em MB (None se indisponível)."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def execucao_ativa():
+    """A Execucao ativa neste processo, ou None."""
+    return _ATIVA
+
+
+@contextmanager
+def etapa(nome, **contagens):
+    """
+    Mede o bloco como uma etapa da Execucao ativa (se houver).
+
+    Entrega o dicionário do registro; a etapa pode completar contagens como
+    registro['linhas_saida'] ou registro['descartadas_mad'] dentro do bloco.
+    """
+    if _ATIVA is None:
+        yield dict(contagens)
+        return
+    with _ATIVA.etapa(nome, **contagens) as registro:
+        yield registro
+
+
+class Execucao:
+    """Coleta os registros das etapas de uma execução."""
+
+    def __init__(self, nome='execucao', memoria=False, perfil=None):
+        self.nome = nome
+        self.memoria = memoria
+        self.perfil = perfil
+        self.etapas = []
+        self._pilha = []
+        self._perfilador = None
+        self._inicio = None
+        self._inicio_cpu = None
+        self._anterior = None
+        self._iniciou_tracemalloc = False
+        self.segundos = None
+        self.segundos_cpu = None
+        self.data = None
+
+    def iniciar(self):
+        """Torna esta execução a ativa e começa as medições."""
+        global _ATIVA
+        self._anterior = _ATIVA
+        _ATIVA = self
+        self.data = datetime.now().isoformat(timespec='seconds')
+        if self.memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._iniciou_tracemalloc = True
+        if self.perfil:
+            import cProfile
+            self._perfilador = cProfile.Profile()
+            self._perfilador.enable()
+        self._inicio = time.perf_counter()
+        self._inicio_cpu = time.process_time()
+        return self
+
+    def finalizar(self):
+        """Encerra as medições (e grava o perfil, se pedido)."""
+        global _ATIVA
+        self.segundos = time.perf_counter() - self._inicio
+        self.segundos_cpu = time.process_time() - self._inicio_cpu
+        if self._perfilador is not None:
+            self._perfilador.disable()
+            self._perfilador.dump_stats(self.perfil)
+            self._perfilador = None
+        if self._iniciou_tracemalloc:
+            tracemalloc.stop()
+            self._iniciou_tracemalloc = False
+        _ATIVA = self._anterior
+        return self
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.finalizar()
+        return False
+
+    @contextmanager
+    def etapa(self, nome, **contagens):
+        """Mede o bloco como uma etapa desta execução (ver a função etapa)."""
+        registro = {'etapa': nome, 'nivel': len(self._pilha)}
+        registro.update(contagens)
+        self.etapas.append(registro)
+        medir_memoria = self.memoria and tracemalloc.is_tracing()
+        if medir_memoria:
+            # O pico de cada etapa é medido desde o seu início; o da etapa de
+            # fora continua valendo, pois é repassado antes do reset
+            if self._pilha:
+                pai = self._pilha[-1]
+                pai['_pico'] = max(pai['_pico'], tracemalloc.get_traced_memory()[1])
+            registro['_memoria_inicio'] = tracemalloc.get_traced_memory()[0]
+            registro['_pico'] = 0
+            tracemalloc.reset_peak()
+        self._pilha.append(registro)
+        inicio = time.perf_counter()
+        inicio_cpu = time.process_time()
+        try:
+            yield registro
+        finally:
+            registro['segundos'] = time.perf_counter() - inicio
+            registro['segundos_cpu'] = time.process_time() - inicio_cpu
+            self._pilha.pop()
+            if medir_memoria:
+                pico = max(registro.pop('_pico'), tracemalloc.get_traced_memory()[1])
+                registro['pico_memoria_mb'] = (pico - registro.pop('_memoria_inicio')) / (1024 * 1024)
+                if self._pilha:
+                    self._pilha[-1]['_pico'] = max(self._pilha[-1]['_pico'], pico)
+                tracemalloc.reset_peak()
+            registro['rss_max_mb'] = rss_max_mb()
+
+    def tabela(self):
+        """Registros das etapas, na ordem em que começaram."""
+        colunas = ['etapa', 'nivel', 'segundos', 'segundos_cpu', 'pico_memoria_mb', 'rss_max_mb',
+                   'linhas_entrada', 'linhas_saida']
+        df = pd.DataFrame(self.resumo()['etapas'])
+        extras = [c for c in df.columns if c not in colunas]
+        return df.reindex(columns=colunas + extras)
+
+    def resumo(self):
+        """Relatório da execução (metadados + etapas) como dicionário serializável em JSON."""
+        etapas = [{k: v for k, v in registro.items() if not k.startswith('_')} for registro in self.etapas]
+        return {
+            'nome': self.nome,
+            'data': self.data,
+            'segundos': self.segundos,
+            'segundos_cpu': self.segundos_cpu,
+            'rss_max_mb': rss_max_mb(),
+            'memoria_medida': self.memoria,
+            'perfil': self.perfil,
+            'ambiente': {
+                'python': platform.python_version(),
+                'plataforma': platform.platform(),
+                'pid': os.getpid(),
+            },
+            'etapas': etapas,
+        }
+
+    def salvar(self, caminho):
+        """Grava o relatório em JSON (metadados + etapas) ou CSV (só as etapas), pela extensão."""
+        if caminho.lower().endswith('.csv'):
+            self.tabela().to_csv(caminho, index=False)
+        else:
+            with open(caminho, 'w', encoding='utf-8') as f:
+                json.dump(self.resumo(), f, ensure_ascii=False, indent=2, default=_json_padrao)
+        return caminho
+
+
+def _json_padrao(valor):
+    # Escalares do NumPy (int64, float64) vindos das contagens
+    if hasattr(valor, 'item'):
+        return valor.item()
+    raise TypeError(f"Valor não serializável em JSON: {valor!r}")
@@ -0,0 +1,212 @@
+"""
+Execução em lote para todas as UFs.
+
+Os microdados são lidos uma única vez, particionados por 'uf' e cada UF passa
+pelo pipeline completo (cesta_pof.pipeline.analisar_uf) em um pool de processos.
+As tabelas de todas as UFs são consolidadas em um único relatório, junto com o
+tempo de processamento de cada UF e o tempo e as contagens de linhas de cada
+etapa (tabela 'etapas').
+
+Com --incremental os registros não são carregados: o agregado de cada UF é
+acumulado em uma passada pelos CSVs (cesta_pof.incremental) e só os agregados
+vão para o pool. Com --peso, o fator de expansão é lido uma vez e cada UF
+recebe a sua parte.
+
+Uso:
+    python -m cesta_pof.lote Consume_Basket_DRP/POF2018.csv --saida relatorio_todos_estados.xlsx
+    python -m cesta_pof.lote POF_nacional.csv --incremental
+    python -m cesta_pof.lote POF_nacional.csv --peso peso_final
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from cesta_pof.cestas import FATOR_DEFLACAO, MULTIPLICADOR_MAD, QUANTIL_POBREZA, AgregadoBase, anexar_fator_expansao
+from cesta_pof.incremental import agregar_por_uf, lista_caminhos
+from cesta_pof.ingestao import COLUNA_PESO_PADRAO, DIR_CACHE_PADRAO, carregar_pof, ler_fator_expansao
+from cesta_pof.instrumentacao import Execucao
+from cesta_pof.pipeline import analisar_base, analisar_uf, tabelas_consolidadas
+from cesta_pof.relatorio import Relatorio
+
+
+def _registros(dados):
+    # Número de registros de despesa de uma partição (registros ou agregado base)
+    if isinstance(dados, AgregadoBase):
+        return int(dados.contagem_grupo.to_numpy().sum())
+    return len(dados)
+
+
+def _processar_uf(uf, dados, parametros, fator_expansao=None):
+    # Executado nos processos do pool; devolve só as tabelas, não os agregados
+    with Execucao(f'uf_{uf}') as execucao:
+        if isinstance(dados, AgregadoBase):
+            if fator_expansao is not None:
+                dados = anexar_fator_expansao(dados, fator_expansao)
+            resultado = analisar_base(dados, uf, **parametros)
+        else:
+            resultado = analisar_uf(dados, uf=uf, fator_expansao=fator_expansao, **parametros)
+        tabelas = tabelas_consolidadas(resultado)
+    etapas = execucao.tabela()
+    etapas.insert(0, 'uf', uf)
+    tabelas['etapas'] = etapas
+    tempo = {
+        'uf': uf,
+        'registros': _registros(dados),
+        'domicilios': len(resultado.base.por_grupo),
+        'segundos': execucao.segundos,
+        'segundos_cpu': execucao.segundos_cpu,
+        'pid': os.getpid(),
+    }
+    return tabelas, tempo
+
+
+def _fator_por_uf(fator_expansao, caminho, ufs):
+    # {uf: fator de expansão da UF}; uma coluna do CSV é lida uma única vez para todas as UFs
+    if fator_expansao is None:
+        return {}
+    if isinstance(fator_expansao, str):
+        fator_expansao = pd.concat([ler_fator_expansao(c, fator_expansao) for c in lista_caminhos(caminho)])
+    return {int(uf): parte for uf, parte in fator_expansao.groupby(level='uf', sort=False)
+            if ufs is None or uf in ufs}
+
+
+def executar_todos_estados(caminho, ufs=None, processos=None, dir_cache=DIR_CACHE_PADRAO, incremental=False,
+                           fator_expansao=None, **parametros):
+    """
+    Roda o pipeline para cada UF presente no arquivo (ou só para `ufs`).
+
+    Retorna um dicionário {nome da tabela: DataFrame com todas as UFs}, incluindo
+    a tabela 'tempos' com o tempo de cada UF. processos=1 executa sem pool.
+    Com incremental=True, `caminho` pode ser uma lista de arquivos. fator_expansao
+    é o nome da coluna de peso dos CSVs ou uma Series por (domicilio, uf).
+    """
+    inicio = time.perf_counter()
+    fatores = _fator_por_uf(fator_expansao, caminho, ufs)
+    if incremental:
+        particoes = agregar_por_uf(caminho, ufs)
+    else:
+        df = carregar_pof(caminho, uf=None, dir_cache=dir_cache)
+        if ufs is not None:
+            df = df[df['uf'].isin(ufs)]
+        particoes = {int(uf): parte.reset_index(drop=True) for uf, parte in df.groupby('uf', sort=True)}
+        del df
+    if not particoes:
+        raise ValueError("Nenhum registro encontrado para as UFs solicitadas")
+    sem_pesos = [uf for uf in particoes if fator_expansao is not None and uf not in fatores]
+    if sem_pesos:
+        # Uma UF sem pesos sairia não ponderada no meio das ponderadas
+        raise ValueError(f"Fator de expansão não encontrado para a(s) UF(s) {', '.join(map(str, sem_pesos))}")
+    tempo_leitura = time.perf_counter() - inicio
+    print(f"Microdados lidos em {tempo_leitura:.2f}s: {len(particoes)} UFs.")
+
+    por_tabela = {}
+    tempos = []
+
+    def _coletar(tabelas, tempo):
+        for nome, tabela in tabelas.items():
+            por_tabela.setdefault(nome, []).append(tabela)
+        tempos.append(tempo)
+        print(f"UF {tempo['uf']:>2}: {tempo['registros']} registros, {tempo['domicilios']} domicílios, "
+              f"{tempo['segundos']:.2f}s")
+
+    if processos == 1:
+        for uf, dados in particoes.items():
+            _coletar(*_processar_uf(uf, dados, parametros, fatores.get(uf)))
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            # UFs maiores primeiro, para equilibrar a carga entre os processos
+            ordem = sorted(particoes, key=lambda uf: _registros(particoes[uf]), reverse=True)
+            futuros = [pool.submit(_processar_uf, uf, particoes[uf], parametros, fatores.get(uf)) for uf in ordem]
+            for futuro in as_completed(futuros):
+                _coletar(*futuro.result())
+
+    consolidado = {
+        nome: pd.concat(partes, ignore_index=True).sort_values('uf', kind='stable').reset_index(drop=True)
+        for nome, partes in por_tabela.items()
+    }
+    consolidado['tempos'] = pd.DataFrame(tempos).sort_values('uf').reset_index(drop=True)
+    print(f"Total: {time.perf_counter() - inicio:.2f}s (leitura {tempo_leitura:.2f}s).")
+    return consolidado
+
+
+def relatorio_consolidado(consolidado):
+    """Relatório com uma aba por tabela consolidada."""
+    relatorio = Relatorio()
+    for nome, tabela in consolidado.items():
+        relatorio.adicionar(nome[:31], tabela)
+    return relatorio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análise da cesta de consumo para todas as UFs da POF.")
+    parser.add_argument('entrada', nargs='+', help="CSV com os registros de despesa da POF "
+                                                   "(vários arquivos implicam --incremental)")
+    parser.add_argument('--saida', default='relatorio_todos_estados.xlsx', help="arquivo Excel consolidado")
+    parser.add_argument('--dir-tabelas', help="também grava cada tabela neste diretório")
+    parser.add_argument('--formato-tabelas', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--ufs', type=int, nargs='+', help="restringe às UFs indicadas")
+    parser.add_argument('--processos', type=int, default=None, help="número de processos (padrão: todos os núcleos)")
+    parser.add_argument('--deflator', type=float, default=FATOR_DEFLACAO)
+    parser.add_argument('--quantil', type=float, default=QUANTIL_POBREZA)
+    parser.add_argument('--multiplicador-mad', type=float, default=MULTIPLICADOR_MAD)
+    parser.add_argument('--replicas-bootstrap', type=int, default=0,
+                        help="réplicas de bootstrap para os intervalos de confiança (0 desativa)")
+    parser.add_argument('--semente', type=int, default=None)
+    parser.add_argument('--incremental', action='store_true',
+                        help="agrega os CSVs em blocos, sem manter os registros em memória")
+    parser.add_argument('--peso', metavar='COLUNA',
+                        help="pondera as estatísticas pelo fator de expansão nesta coluna dos CSVs")
+    parser.add_argument('--arquivo-pesos', metavar='CSV',
+                        help="CSV à parte com uf, domicilio e a coluna de --peso (padrão: peso_final)")
+    args = parser.parse_args(argv)
+
+    fator_expansao = args.peso
+    if args.arquivo_pesos:
+        try:
+            fator_expansao = ler_fator_expansao(args.arquivo_pesos, args.peso or COLUNA_PESO_PADRAO)
+        except (OSError, ValueError) as erro:
+            print(f"Erro no arquivo de pesos: {erro}", file=sys.stderr)
+            return 1
+
+    incremental = args.incremental or len(args.entrada) > 1
+    try:
+        consolidado = executar_todos_estados(
+            args.entrada if incremental else args.entrada[0], ufs=args.ufs, processos=args.processos,
+            incremental=incremental, fator_expansao=fator_expansao,
+            fator_deflacao=args.deflator, quantil=args.quantil, multiplicador_mad=args.multiplicador_mad,
+            replicas_bootstrap=args.replicas_bootstrap, semente=args.semente,
+        )
+    except FileNotFoundError as erro:
+        print(f"Arquivo '{erro.filename}' não encontrado.", file=sys.stderr)
+        return 1
+    except ValueError as erro:
+        print(f"{erro}.", file=sys.stderr)
+        return 1
+    relatorio = relatorio_consolidado(consolidado)
+    dir_tabelas, formato = args.dir_tabelas, args.formato_tabelas
+    try:
+        relatorio.salvar_excel(args.saida)
+        print(f"Relatório consolidado salvo em '{args.saida}'.")
+    except ImportError:
+        print("\nAVISO: Para salvar em Excel, a biblioteca 'xlsxwriter' ou 'openpyxl' é necessária.")
+        print("Por favor, instale-a usando o comando: pip install xlsxwriter")
+        # O processamento de todas as UFs não se perde: as tabelas vão para um diretório ao lado
+        dir_tabelas = dir_tabelas or os.path.splitext(args.saida)[0]
+    if dir_tabelas:
+        try:
+            relatorio.salvar_tabelas(dir_tabelas, formato)
+        except ImportError:
+            print("\nAVISO: Para gravar as tabelas em Parquet, a biblioteca 'pyarrow' é necessária.")
+            print("Por favor, instale-a usando o comando: pip install pyarrow")
+            formato = 'csv'
+            relatorio.salvar_tabelas(dir_tabelas, formato)
+        print(f"Tabelas gravadas em '{dir_tabelas}' ({formato}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Matriz esparsa domicílio x subitem para explorar cestas contrafactuais.
+
+O agregado por domicílio x subitem (AgregadoBase.por_subitem) vira uma matriz
+CSR de gasto e outra de número de registros, com os mapas de linhas (domicílios)
+e colunas (cod_subitem). Uma lista de exclusão é um vetor 0/1 sobre as colunas:
+totais por grupo, gasto de cada cesta e somas por subitem de um conjunto de
+domicílios passam a ser produtos matriz-vetor. Com várias listas lado a lado
+(uma matriz subitens x candidatos), milhares de cestas são avaliadas de uma vez
+quanto ao efeito na linha de pobreza e no HCR. Com o fator de expansão no
+agregado base, mediana, MAD, linha e HCR são ponderados.
+
+Sem scipy a matriz é montada densa (mesmos resultados, mais memória).
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from cesta_pof.cestas import FATOR_DEFLACAO, FATOR_SIGMA_MAD, MULTIPLICADOR_MAD, QUANTIL_POBREZA
+from cesta_pof.ponderado import quantis_colunas
+
+# Limite aproximado de células por lote (domicílios x candidatos)
+CELULAS_POR_LOTE = 2_000_000
+
+
+@dataclass
+class MatrizSubitens:
+    """Gasto e registros por domicílio x subitem, com os mapas de linhas e colunas."""
+    gasto: object            # domicílios x subitens (CSR, ou ndarray sem scipy)
+    contagem: object         # domicílios x subitens: número de registros
+    domicilios: pd.Index     # (domicilio, uf) de cada linha, como em AgregadoBase.por_grupo
+    codigos: np.ndarray      # cod_subitem de cada coluna, em ordem crescente
+    grupos: list             # nomes dos grupos, na ordem das colunas de por_grupo
+    grupo_coluna: np.ndarray  # posição em `grupos` do grupo de cada coluna
+    fator_expansao: np.ndarray = None  # peso amostral de cada linha (None: sem pesos)
+
+    @property
+    def forma(self):
+        return len(self.domicilios), len(self.codigos)
+
+    def colunas(self, codigos):
+        """Posições das colunas dos códigos (os ausentes da matriz são ignorados)."""
+        codigos = np.unique(np.asarray(list(codigos), dtype=np.int64))
+        if not len(self.codigos):
+            return np.zeros(0, dtype=np.int64)
+        posicoes = np.searchsorted(self.codigos, codigos)
+        posicoes = np.minimum(posicoes, len(self.codigos) - 1)
+        return posicoes[self.codigos[posicoes] == codigos]
+
+    def mascara(self, excluir=()):
+        """Vetor 0/1 das colunas que ficam na cesta sem os subitens de `excluir`."""
+        mascara = np.ones(len(self.codigos))
+        mascara[self.colunas(excluir)] = 0.0
+        return mascara
+
+    def mascaras(self, conjuntos):
+        """Matriz subitens x candidatos com a máscara de cada lista de exclusão."""
+        mascaras = np.ones((len(self.codigos), len(conjuntos)))
+        for j, excluir in enumerate(conjuntos):
+            mascaras[self.colunas(excluir), j] = 0.0
+        return mascaras
+
+    def indicadora_grupos(self, mascara=None):
+        """Matriz subitens x grupos com 1 na coluna do grupo de cada subitem (vezes a máscara)."""
+        indicadora = np.zeros((len(self.codigos), len(self.grupos)))
+        indicadora[np.arange(len(self.codigos)), self.grupo_coluna] = 1.0 if mascara is None else mascara
+        return indicadora
+
+
+def _denso(matriz):
+    return matriz.toarray() if hasattr(matriz, 'toarray') else np.asarray(matriz)
+
+
+def matriz_subitens(base):
+    """Monta a MatrizSubitens a partir de um AgregadoBase (sem voltar aos registros)."""
+    por_subitem = base.por_subitem
+    domicilios = base.por_grupo.index
+    codigos = np.sort(base.subitens.index.to_numpy())
+    grupos = list(base.por_grupo.columns)
+
+    linhas = domicilios.get_indexer(pd.MultiIndex.from_arrays([por_subitem['domicilio'], por_subitem['uf']]))
+    colunas = np.searchsorted(codigos, por_subitem['cod_subitem'].to_numpy())
+    forma = (len(domicilios), len(codigos))
+    gasto = por_subitem['gasto'].to_numpy(dtype=float)
+    contagem = por_subitem['n_registros'].to_numpy()
+
+    try:
+        from scipy import sparse
+    except ImportError:
+        print("\nAVISO: Para a matriz esparsa domicílio x subitem, a biblioteca 'scipy' é necessária.")
+        print("Por favor, instale-a usando o comando: pip install scipy")
+        matriz_gasto = np.zeros(forma)
+        matriz_contagem = np.zeros(forma, dtype=np.int32)
+        matriz_gasto[linhas, colunas] = gasto
+        matriz_contagem[linhas, colunas] = contagem
+    else:
+        matriz_gasto = sparse.csr_matrix((gasto, (linhas, colunas)), shape=forma)
+        matriz_contagem = sparse.csr_matrix((contagem, (linhas, colunas)), shape=forma)
+
+    nome_grupo = base.subitens['nome_grupo'].reindex(codigos).to_numpy()
+    grupo_coluna = pd.Index(grupos).get_indexer(nome_grupo)
+    fator = None if base.fator_expansao is None else base.fator_expansao.to_numpy(dtype=float)
+    return MatrizSubitens(matriz_gasto, matriz_contagem, domicilios, codigos, grupos, grupo_coluna, fator)
+
+
+def gastos_por_grupo(matriz, excluir=()):
+    """
+    Gasto domicílio x grupo da cesta sem os subitens de `excluir`.
+
+    Mesmos valores de cestas.cesta_por_grupo: domicílios e grupos que ficam sem
+    registros são retirados.
+    """
+    mascara = matriz.mascara(excluir)
+    indicadora = matriz.indicadora_grupos(mascara)
+    gasto = _denso(matriz.gasto @ indicadora)
+    contagem = _denso(matriz.contagem @ indicadora)
+    gasto[contagem == 0] = 0.0
+    linhas, colunas = contagem.sum(axis=1) > 0, contagem.sum(axis=0) > 0
+    return pd.DataFrame(gasto[np.ix_(linhas, colunas)], index=matriz.domicilios[linhas],
+                        columns=pd.Index(np.asarray(matriz.grupos)[colunas], name='nome_grupo'))
+
+
+def somas_subitens(matriz, domicilios=None):
+    """
+    Gasto e número de registros de cada subitem, em todos os domicílios ou só nos
+    indicados (vetor booleano sobre as linhas). Retorna um DataFrame por cod_subitem.
+    """
+    if domicilios is None:
+        vetor = np.ones(len(matriz.domicilios))
+    else:
+        vetor = np.asarray(domicilios, dtype=float)
+    return pd.DataFrame({
+        'gasto': np.ravel(matriz.gasto.T @ vetor),
+        'n_registros': np.ravel(matriz.contagem.T @ vetor).astype(np.int64),
+    }, index=pd.Index(matriz.codigos, name='cod_subitem'))
+
+
+def _medianas(ordenados, n):
+    # Mediana de cada coluna de uma matriz ordenada com os n[j] primeiros valores válidos
+    colunas = np.arange(ordenados.shape[1])
+    meio = np.maximum(n - 1, 0) // 2
+    return (ordenados[meio, colunas] + ordenados[np.maximum(n // 2, meio), colunas]) / 2
+
+
+def _ordem(valores, validos):
+    # Ordem de cada coluna com as linhas de `validos` no início; a ordem entre empates não muda os quantis
+    return np.argsort(np.where(validos, valores, np.inf), axis=0)
+
+
+def _quantis_ponderados(valores, pesos, validos, n, quantil, ordem=None):
+    # Quantil ponderado de cada coluna considerando só as linhas de `validos`
+    if ordem is None:
+        ordem = _ordem(valores, validos)
+    # As n[j] primeiras posições da ordem são as válidas
+    pesos_ordenados = np.where(np.arange(len(ordem))[:, None] < n, pesos[ordem], 0.0)
+    return quantis_colunas(np.take_along_axis(valores, ordem, axis=0), pesos_ordenados, quantil, n)
+
+
+def linhas_lote(nominal, contagem, fator_deflacao=FATOR_DEFLACAO, quantil=QUANTIL_POBREZA,
+                multiplicador_mad=MULTIPLICADOR_MAD, pesos=None):
+    """
+    Linha de pobreza e HCR de cada coluna de `nominal` (domicílios x candidatos).
+
+    Repete calcular_cesta coluna a coluna, de forma vetorizada: domicílios com
+    contagem 0 ficam de fora, o gasto é deflacionado, aparado por MAD no log e a
+    linha é o quantil linear do gasto real. Com `pesos` (fator de expansão por
+    domicílio) as estatísticas são ponderadas. Retorna um dicionário de vetores.
+    """
+    valido = contagem > 0
+    n = valido.sum(axis=0)
+    real = nominal / fator_deflacao
+    log = np.where(valido, np.log(real + 1), np.nan)
+
+    if pesos is None:
+        # NaN vai para o fim na ordenação: os n[j] primeiros valores de cada coluna são os válidos
+        mediana = _medianas(np.sort(log, axis=0), n)
+        mad = _medianas(np.sort(np.abs(log - mediana), axis=0), n)
+    else:
+        pesos = np.asarray(pesos, dtype=float)
+        ordem = _ordem(log, valido)
+        mediana = _quantis_ponderados(log, pesos, valido, n, 0.5, ordem)
+        mad = _quantis_ponderados(np.abs(log - mediana), pesos, valido, n, 0.5)
+    sigma_mad = FATOR_SIGMA_MAD * mad
+    limite_inferior = mediana - multiplicador_mad * sigma_mad
+    dentro = (log >= limite_inferior) & (log <= mediana + multiplicador_mad * sigma_mad)
+    m = dentro.sum(axis=0)
+
+    if pesos is None:
+        ordenados = np.sort(np.where(dentro, real, np.nan), axis=0)
+        colunas = np.arange(real.shape[1])
+        h = quantil * np.maximum(m - 1, 0)
+        inferior = np.floor(h).astype(np.int64)
+        superior = np.minimum(inferior + 1, np.maximum(m - 1, 0))
+        v_inf = ordenados[inferior, colunas]
+        linha = v_inf + (h - inferior) * (ordenados[superior, colunas] - v_inf)
+        pesos_dentro = dentro
+    else:
+        # `dentro` é um trecho contínuo da ordem do log (e do gasto real, que cresce com ele):
+        # girando cada coluna para o início do trecho, a mesma ordem serve para a linha
+        inicio = (valido & (log < limite_inferior)).sum(axis=0)
+        giro = (np.arange(len(ordem))[:, None] + inicio) % max(len(ordem), 1)
+        linha = _quantis_ponderados(real, pesos, dentro, m, quantil, np.take_along_axis(ordem, giro, axis=0))
+        pesos_dentro = np.where(dentro, pesos[:, None], 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = pesos_dentro.sum(axis=0)
+        hcr_adj = (pesos_dentro * (real <= linha)).sum(axis=0) / total
+        hcr = (pesos_dentro * (nominal <= linha)).sum(axis=0) / total
+    linha = np.where(m > 0, linha, np.nan)
+    return {'domicilios': m, 'descartadas_mad': n - m, 'linha_pobreza': linha, 'HCR_adj': hcr_adj, 'HCR': hcr}
+
+
+def _totais(matriz, conjuntos):
+    # Gasto nominal e número de registros de cada domicílio em cada cesta candidata
+    mascaras = matriz.mascaras(conjuntos)
+    return _denso(matriz.gasto @ mascaras), _denso(matriz.contagem @ mascaras)
+
+
+def avaliar_exclusoes(matriz, conjuntos, fator_deflacao=FATOR_DEFLACAO, quantil=QUANTIL_POBREZA,
+                      multiplicador_mad=MULTIPLICADOR_MAD, referencia=()):
+    """
+    Linha de pobreza e HCR (em %) da cesta sem cada conjunto de subitens.
+
+    conjuntos é {nome: subitens excluídos}, como as variantes de calcular_cestas,
+    ou uma lista de listas (nomeadas pela posição). A variação da linha é medida
+    contra a cesta sem os subitens de `referencia` (padrão: a cesta bruta).
+    Retorna um DataFrame com uma linha por conjunto.
+    """
+    if not isinstance(conjuntos, dict):
+        conjuntos = dict(enumerate(conjuntos))
+    nomes = list(conjuntos)
+    listas = [conjuntos[nome] for nome in nomes]
+    parametros = (fator_deflacao, quantil, multiplicador_mad, matriz.fator_expansao)
+
+    base_ref = linhas_lote(*_totais(matriz, [referencia]), *parametros)['linha_pobreza'][0]
+    tamanho_lote = max(1, CELULAS_POR_LOTE // max(len(matriz.domicilios), 1))
+    partes = []
+    for inicio in range(0, len(listas), tamanho_lote):
+        lote = listas[inicio:inicio + tamanho_lote]
+        partes.append(pd.DataFrame(linhas_lote(*_totais(matriz, lote), *parametros)))
+    tabela = pd.concat(partes, ignore_index=True)
+
+    return pd.DataFrame({
+        'conjunto': nomes,
+        'subitens_excluidos': [len(matriz.colunas(excluir)) for excluir in listas],
+        'domicilios': tabela['domicilios'].to_numpy(),
+        'descartadas_mad': tabela['descartadas_mad'].to_numpy(),
+        'linha_pobreza': tabela['linha_pobreza'].to_numpy(),
+        'Variação da linha (%)': (tabela['linha_pobreza'].to_numpy() / base_ref - 1) * 100,
+        'HCR_adj (%)': tabela['HCR_adj'].to_numpy() * 100,
+        'HCR (%)': tabela['HCR'].to_numpy() * 100,
+    })
+
+
+def candidatos_marginais(codigos, referencia=()):
+    """
+    Um conjunto por subitem de `codigos`: a lista de referência com esse subitem
+    trocado (retirado se já estava excluído, acrescentado se não estava).
+    """
+    referencia = set(int(c) for c in referencia)
+    return {int(c): sorted(referencia ^ {int(c)}) for c in codigos}
@@ -0,0 +1,407 @@
+"""
+Pipeline da análise de uma UF: classificação, agregação, cestas (deflação, corte
+MAD e linha de pobreza), tabelas de pesos, tabelas Real vs Nominal e composição
+da cesta até a linha de pobreza.
+"""
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+import pandas as pd
+
+from cesta_pof.bootstrap import bootstrap_cesta
+from cesta_pof.cache import chave, chave_dataframe, chave_esquema, chave_exclusoes
+from cesta_pof.cestas import (
+    CESTAS_PADRAO,
+    FATOR_DEFLACAO,
+    MULTIPLICADOR_MAD,
+    PERCENTUAIS_HCR,
+    QUANTIL_POBREZA,
+    AgregadoBase,
+    agregar_base,
+    anexar_fator_expansao,
+    calcular_cesta,
+    cesta_por_grupo,
+    pesos_subitens,
+    rotulo_linha,
+)
+from cesta_pof.classificacao import classificar
+from cesta_pof.composicao import composicao_ate_linha
+from cesta_pof.incremental import agregar_arquivos, lista_caminhos
+from cesta_pof.ingestao import DIR_CACHE_PADRAO, carregar_pof, fator_expansao_de, hash_arquivo, ler_fator_expansao
+from cesta_pof.indicadores import gini_theil, indicadores_real_nominal
+from cesta_pof.instrumentacao import etapa
+from cesta_pof.ponderado import proporcoes_ate_ponderadas
+from cesta_pof.relatorio import FORMATO_DUAS_CASAS, FORMATO_MOEDA, FORMATO_PERCENTUAL, Relatorio
+from cesta_pof.sensibilidade import proporcoes_ate, varredura
+
+CESTA_REFERENCIA = 'Refinada'
+AMPLITUDE_FAIXA = 0.20
+PONTOS_FAIXA = 11
+
+
+@dataclass
+class ResultadoUF:
+    """Resultados da análise de uma UF."""
+    uf: int
+    base: AgregadoBase
+    cestas: dict
+    cesta_referencia: str
+    detalhes: dict = field(default_factory=dict)
+    tabela_hcr: pd.DataFrame = None
+    tabela_faixa: pd.DataFrame = None
+    tabela_desigualdade: pd.DataFrame = None
+    composicao_grupo: pd.DataFrame = None
+    composicao_subitem: pd.DataFrame = None
+    bootstrap: pd.DataFrame = None
+    sensibilidade: pd.DataFrame = None
+
+    @property
+    def referencia(self):
+        return self.cestas[self.cesta_referencia]
+
+
+def tabela_real_vs_nominal(df_final, linha_pobreza, percentuais=PERCENTUAIS_HCR, quantil=QUANTIL_POBREZA,
+                           pesos=None):
+    """
+    HCR com gasto real (HCR_adj) e nominal para a linha ajustada em cada percentual,
+    seguidos do hiato (P1), severidade (P2) e índice de Watts. Valores em %, exceto Watts.
+    Com `pesos` (fator de expansão alinhado a df_final), os indicadores são ponderados.
+    """
+    linhas_ajustadas = linha_pobreza * (1 + np.asarray(percentuais, dtype=float))
+    ind = indicadores_real_nominal(df_final, linhas_ajustadas, pesos)
+    return pd.DataFrame({
+        "Linha de pobreza": [rotulo_linha(pct, quantil) for pct in percentuais],
+        "BRL": linhas_ajustadas,
+        "HCR_adj (%)": ind['P0_adj'] * 100,
+        "HCR (%)": ind['P0'] * 100,
+        "Change from HCR (%)": (ind['P0_adj'] - ind['P0']) * 100,
+        "P1_adj (%)": ind['P1_adj'] * 100,
+        "P1 (%)": ind['P1'] * 100,
+        "P2_adj (%)": ind['P2_adj'] * 100,
+        "P2 (%)": ind['P2'] * 100,
+        "Watts_adj": ind['Watts_adj'],
+        "Watts": ind['Watts'],
+    })
+
+
+def _ordenar(valores, pesos):
+    # Valores em ordem crescente e os pesos (ou None) na mesma ordem
+    if pesos is None:
+        return np.sort(valores), None
+    ordem = np.argsort(valores, kind='stable')
+    return valores[ordem], np.asarray(pesos, dtype=float)[ordem]
+
+
+def tabela_desigualdade(df_final, pesos=None):
+    """Gini e Theil do gasto real e do nominal (ponderados, com pesos)."""
+    linhas = []
+    for rotulo, coluna in (('Real', 'gasto_real'), ('Nominal', 'gasto_nominal')):
+        ordenados, pesos_ordenados = _ordenar(df_final[coluna].to_numpy(dtype=float), pesos)
+        gini, theil = gini_theil(ordenados, pesos=pesos_ordenados)
+        linhas.append([rotulo, gini, theil])
+    return pd.DataFrame(linhas, columns=['Gasto', 'Gini', 'Theil'])
+
+
+def tabela_faixa(df_final, linha_pobreza, amplitude=AMPLITUDE_FAIXA, pontos=PONTOS_FAIXA, pesos=None):
+    """Proporção acumulada real e nominal em pontos igualmente espaçados na faixa +-amplitude da linha (em %)."""
+    valores = np.linspace(linha_pobreza * (1 - amplitude), linha_pobreza * (1 + amplitude), pontos)
+    proporcoes = []
+    for coluna in ('gasto_real', 'gasto_nominal'):
+        ordenados, pesos_ordenados = _ordenar(df_final[coluna].to_numpy(dtype=float), pesos)
+        if pesos is None:
+            proporcoes.append(proporcoes_ate(ordenados, valores))
+        else:
+            proporcoes.append(proporcoes_ate_ponderadas(ordenados, pesos_ordenados, valores))
+    prop_real, prop_nominal = proporcoes
+    return pd.DataFrame({
+        'Valor (R$)': valores,
+        'Proporção Real (%)': prop_real * 100,
+        'Proporção Nominal (%)': prop_nominal * 100,
+        'Diferença Real-Nominal (%)': (prop_real - prop_nominal) * 100,
+    })
+
+
+def _memo(cache, chave_artefato, funcao):
+    if cache is None:
+        return funcao()
+    return cache.memo(chave_artefato, funcao)
+
+
+def classificar_registros(df_registros, esquema=None):
+    """Registros com a coluna 'nome_grupo' (classificados aqui se ainda não a tiverem)."""
+    if 'nome_grupo' in df_registros.columns:
+        return df_registros
+    with etapa('classificacao', linhas_entrada=len(df_registros), linhas_saida=len(df_registros)):
+        return df_registros.assign(nome_grupo=classificar(df_registros['cod_subitem'], esquema))
+
+
+def _agregar(df_registros):
+    with etapa('agregacao', linhas_entrada=len(df_registros)) as registro:
+        base = agregar_base(df_registros)
+        registro['linhas_saida'] = len(base.por_grupo)
+    return base
+
+
+def analisar_uf(df_registros, uf=None, variantes=None, cesta_referencia=CESTA_REFERENCIA,
+                fator_deflacao=FATOR_DEFLACAO, quantil=QUANTIL_POBREZA, multiplicador_mad=MULTIPLICADOR_MAD,
+                esquema=None, replicas_bootstrap=0, semente=None, grade_sensibilidade=None, cache=None,
+                fator_expansao=None):
+    """
+    Executa a análise completa sobre os registros de despesa de uma UF.
+
+    Os registros são classificados aqui caso ainda não tenham 'nome_grupo'.
+    As tabelas Real vs Nominal e de composição usam a cesta de referência; com
+    replicas_bootstrap > 0 também os intervalos de confiança por bootstrap.
+    grade_sensibilidade, se informada, é um dicionário com os eixos da varredura
+    (fatores_deflacao, quantis, multiplicadores_mad) aplicada a todas as cestas.
+    Com um CacheEtapas em `cache`, os artefatos intermediários são reaproveitados
+    (a chave dos dados é o hash do conteúdo dos registros). fator_expansao é o
+    nome da coluna de peso nos registros ou uma Series por (domicilio, uf); com
+    ele, todas as estatísticas são ponderadas (cesta_pof.ponderado).
+    """
+    if uf is None and len(df_registros):
+        uf = int(df_registros['uf'].iloc[0])
+    if isinstance(fator_expansao, str):
+        fator_expansao = fator_expansao_de(df_registros, fator_expansao)
+    chave_base = None
+    if cache is not None:
+        chave_base = chave('agregado', chave_dataframe(df_registros), chave_esquema(esquema))
+    base = _memo(cache, chave_base, lambda: _agregar(classificar_registros(df_registros, esquema)))
+    base, chave_base = _ponderar(base, fator_expansao, chave_base)
+    return analisar_base(base, uf, variantes, cesta_referencia, fator_deflacao, quantil, multiplicador_mad,
+                         replicas_bootstrap, semente, grade_sensibilidade, cache=cache, chave_base=chave_base)
+
+
+def _ponderar(base, fator_expansao, chave_base):
+    # Anexa o fator de expansão ao agregado base e o inclui na chave
+    if fator_expansao is None:
+        return base, chave_base
+    base = anexar_fator_expansao(base, fator_expansao)
+    if chave_base is not None:
+        chave_base = chave('expansao', chave_base, base.fator_expansao.to_numpy())
+    return base, chave_base
+
+
+def _ler_fator(caminhos, coluna, uf):
+    with etapa('fator_expansao', arquivos=len(caminhos)) as registro:
+        fator = pd.concat([ler_fator_expansao(c, coluna, uf) for c in caminhos])
+        registro['linhas_saida'] = len(fator)
+    return fator
+
+
+def _carregar(caminho, uf, dir_cache):
+    with etapa('ingestao') as registro:
+        df_registros = carregar_pof(caminho, uf=uf, dir_cache=dir_cache)
+        registro['linhas_saida'] = len(df_registros)
+    return df_registros
+
+
+def analisar_arquivo(caminho, uf, esquema=None, cache=None, dir_cache=DIR_CACHE_PADRAO, incremental=False,
+                     fator_expansao=None, **parametros):
+    """
+    Análise de uma UF direto do CSV da POF (os parâmetros são os de analisar_uf).
+
+    Com um CacheEtapas, a chave parte do hash do arquivo: se o agregado da UF já
+    estiver no cache, o CSV não chega a ser lido. Com incremental=True os
+    registros não ficam em memória: o agregado é acumulado bloco a bloco
+    (cesta_pof.incremental) e `caminho` pode ser uma lista de arquivos.
+    fator_expansao é o nome de uma coluna de peso do próprio CSV ou uma Series
+    por (domicilio, uf). Levanta FileNotFoundError se o arquivo não existir e
+    ValueError se não houver registros da UF.
+    """
+    caminhos = lista_caminhos(caminho) if incremental else [caminho]
+    hashes = None if cache is None else [hash_arquivo(c, dir_cache=dir_cache) for c in caminhos]
+    if isinstance(fator_expansao, str):
+        coluna = fator_expansao
+        fator_expansao = _memo(cache, hashes and chave('fator_expansao', hashes, uf, coluna),
+                               lambda: _ler_fator(caminhos, coluna, uf))
+
+    if incremental:
+        chave_base = None
+        if cache is not None:
+            chave_base = chave('agregado_incremental', hashes, uf, chave_esquema(esquema))
+        base = _memo(cache, chave_base, lambda: agregar_arquivos(caminhos, uf, esquema))
+        base, chave_base = _ponderar(base, fator_expansao, chave_base)
+        return analisar_base(base, uf, cache=cache, chave_base=chave_base, **parametros)
+
+    if cache is None:
+        df_registros = _carregar(caminho, uf, dir_cache)
+        if df_registros.empty:
+            raise ValueError(f"Nenhum registro da UF {uf} em '{caminho}'")
+        return analisar_uf(df_registros, uf=uf, esquema=esquema, fator_expansao=fator_expansao, **parametros)
+
+    chave_registros = chave('registros', hashes[0], uf, chave_esquema(esquema))
+    chave_base = chave('agregado', chave_registros)
+
+    def _base():
+        registros = cache.memo(chave_registros, lambda: classificar_registros(
+            _carregar(caminho, uf, dir_cache), esquema))
+        return _agregar(registros)
+
+    base = cache.memo(chave_base, _base)
+    if base.por_grupo.empty:
+        raise ValueError(f"Nenhum registro da UF {uf} em '{caminho}'")
+    base, chave_base = _ponderar(base, fator_expansao, chave_base)
+    return analisar_base(base, uf, cache=cache, chave_base=chave_base, **parametros)
+
+
+def analisar_base(base, uf, variantes=None, cesta_referencia=CESTA_REFERENCIA, fator_deflacao=FATOR_DEFLACAO,
+                  quantil=QUANTIL_POBREZA, multiplicador_mad=MULTIPLICADOR_MAD, replicas_bootstrap=0, semente=None,
+                  grade_sensibilidade=None, cache=None, chave_base=None):
+    """
+    Cestas e tabelas a partir do agregado base (ver analisar_uf).
+
+    Com cache, cada artefato tem como chave a chave do artefato de que depende
+    mais os próprios parâmetros: o agregado de cada lista de exclusão depende só
+    da lista, a cesta aparada também do deflator, do quantil e do MAD, e as
+    tabelas da cesta de que vêm. O bootstrap só é guardado com semente fixa.
+    """
+    if variantes is None:
+        variantes = CESTAS_PADRAO
+    if cache is not None and chave_base is None:
+        raise ValueError("chave_base é obrigatória quando há cache")
+
+    cestas = {}
+    chaves = {}
+    for nome, excluir in variantes.items():
+        chave_exclusao = chave('cesta_por_grupo', chave_base, chave_exclusoes(excluir))
+        chaves[nome] = chave('cesta', chave_exclusao, fator_deflacao, quantil, multiplicador_mad)
+        cesta = _memo(cache, chaves[nome], lambda: calcular_cesta(
+            base, nome, excluir, fator_deflacao, quantil, multiplicador_mad,
+            agregado=_memo(cache, chave_exclusao, lambda: cesta_por_grupo(base, excluir))))
+        # A mesma lista de exclusão pode ter vindo do cache com outro nome
+        cestas[nome] = cesta if cesta.nome == nome else replace(cesta, nome=nome)
+
+    resultado = ResultadoUF(uf=uf, base=base, cestas=cestas, cesta_referencia=cesta_referencia)
+
+    def _pesos_subitens(cesta):
+        with etapa(f'pesos_subitens_{cesta.nome}', linhas_entrada=len(base.subitens)):
+            return pesos_subitens(base, cesta)
+
+    resultado.detalhes = {
+        nome: _memo(cache, chave('pesos_subitens', chaves[nome]), lambda: _pesos_subitens(cesta))
+        for nome, cesta in cestas.items()
+    }
+
+    referencia = resultado.referencia
+    chave_referencia = chaves[cesta_referencia]
+    # Fator de expansão alinhado a df_final da cesta de referência (None sem pesos)
+    pesos = None if referencia.fator_expansao is None else referencia.fator_expansao.to_numpy(dtype=float)
+
+    def _tabelas_linha():
+        with etapa('tabelas_linha', linhas_entrada=len(referencia.df_final)):
+            return (tabela_real_vs_nominal(referencia.df_final, referencia.linha_pobreza, quantil=quantil,
+                                           pesos=pesos),
+                    tabela_faixa(referencia.df_final, referencia.linha_pobreza, pesos=pesos),
+                    tabela_desigualdade(referencia.df_final, pesos=pesos))
+
+    def _composicao():
+        with etapa('composicao', linhas_entrada=len(referencia.df_final)) as registro:
+            tabelas = composicao_ate_linha(base, referencia.df_final, referencia.linha_pobreza,
+                                           excluir=referencia.excluir, pesos=pesos)
+            registro['linhas_saida'] = len(tabelas[1])
+        return tabelas
+
+    resultado.tabela_hcr, resultado.tabela_faixa, resultado.tabela_desigualdade = _memo(
+        cache, chave('tabelas_linha', chave_referencia), _tabelas_linha)
+    resultado.composicao_grupo, resultado.composicao_subitem = _memo(
+        cache, chave('composicao', chave_referencia), _composicao)
+
+    if replicas_bootstrap:
+        def _bootstrap():
+            with etapa('bootstrap', linhas_entrada=len(referencia.df_final), replicas=replicas_bootstrap):
+                return bootstrap_cesta(referencia.df_final, replicas=replicas_bootstrap, quantil=quantil,
+                                       pesos=pesos, semente=semente)
+        resultado.bootstrap = _memo(None if semente is None else cache,
+                                    chave('bootstrap', chave_referencia, replicas_bootstrap, semente), _bootstrap)
+    if grade_sensibilidade:
+        def _sensibilidade():
+            with etapa('sensibilidade', linhas_entrada=len(base.por_grupo)) as registro:
+                tabela = varredura(base, variantes, **grade_sensibilidade)
+                registro['linhas_saida'] = len(tabela)
+            return tabela
+        chave_variantes = [(nome, chave_exclusoes(excluir)) for nome, excluir in variantes.items()]
+        resultado.sensibilidade = _memo(cache, chave('sensibilidade', chave_base, chave_variantes, grade_sensibilidade),
+                                        _sensibilidade)
+    return resultado
+
+
+def tabelas_consolidadas(resultado):
+    """Tabelas numéricas da UF em formato longo, cada uma com a coluna 'uf' na frente."""
+    linhas = pd.DataFrame([
+        {
+            'cesta': nome,
+            'domicilios': len(cesta.df_agregado),
+            'domicilios_apos_mad': len(cesta.df_final),
+            'registros_removidos': cesta.registros_removidos,
+            'limite_inferior_mad': cesta.limites_mad[0],
+            'limite_superior_mad': cesta.limites_mad[1],
+            'linha_pobreza': cesta.linha_pobreza,
+        }
+        for nome, cesta in resultado.cestas.items()
+    ])
+    pesos = pd.concat([
+        pd.DataFrame({'cesta': nome, 'grupo': cesta.pesos.index, 'peso': cesta.pesos.to_numpy()})
+        for nome, cesta in resultado.cestas.items()
+    ], ignore_index=True)
+    subitens = pd.concat([
+        detalhes.assign(cesta=nome)[['cesta'] + list(detalhes.columns)]
+        for nome, detalhes in resultado.detalhes.items()
+    ], ignore_index=True)
+
+    tabelas = {
+        'linhas_pobreza': linhas,
+        'pesos_grupos': pesos,
+        'pesos_subitens': subitens,
+        'real_vs_nominal': resultado.tabela_hcr,
+        'faixa_20': resultado.tabela_faixa,
+        'desigualdade': resultado.tabela_desigualdade,
+        'composicao_grupo': resultado.composicao_grupo,
+        'composicao_subitem': resultado.composicao_subitem,
+    }
+    if resultado.bootstrap is not None:
+        tabelas['bootstrap'] = resultado.bootstrap
+    if resultado.sensibilidade is not None:
+        tabelas['sensibilidade'] = resultado.sensibilidade
+    return {nome: df.assign(uf=resultado.uf)[['uf'] + list(df.columns)] for nome, df in tabelas.items()}
+
+
+def resumo_pesos(cesta):
+    """Tabela resumo dos pesos dos grupos de uma cesta (peso como fração)."""
+    return pd.DataFrame({
+        'Grupo de Consumo': cesta.pesos.index,
+        'Peso Relativo no Gasto Total': cesta.pesos.to_numpy(),
+    })
+
+
+def relatorio_uf(resultado):
+    """Monta o Relatório com as abas da análise de uma UF, com células numéricas."""
+    relatorio = Relatorio()
+    for nome, cesta in resultado.cestas.items():
+        relatorio.adicionar(f'Resumo_Cesta_{nome}'[:31], resumo_pesos(cesta),
+                            {'Peso Relativo no Gasto Total': FORMATO_PERCENTUAL})
+    for nome, detalhes in resultado.detalhes.items():
+        relatorio.adicionar(f'Itens_Cesta_{nome}'[:31], detalhes,
+                            {'gasto': FORMATO_MOEDA, 'Peso no Grupo (%)': FORMATO_DUAS_CASAS})
+
+    formatos_hcr = {coluna: FORMATO_DUAS_CASAS for coluna in resultado.tabela_hcr.columns[2:]}
+    formatos_hcr.update({'BRL': FORMATO_MOEDA, 'Watts_adj': '0.0000', 'Watts': '0.0000'})
+    relatorio.adicionar('Analise_Real_vs_Nominal', resultado.tabela_hcr, formatos_hcr)
+    relatorio.adicionar('Desigualdade', resultado.tabela_desigualdade, {'Gini': '0.0000', 'Theil': '0.0000'})
+    formatos_faixa = {coluna: FORMATO_DUAS_CASAS for coluna in resultado.tabela_faixa.columns[1:]}
+    formatos_faixa['Valor (R$)'] = FORMATO_MOEDA
+    relatorio.adicionar('Comparacao_Faixa_±20%', resultado.tabela_faixa, formatos_faixa)
+    relatorio.adicionar('Cesta_ate_Linha_Pobreza_Grupo', resultado.composicao_grupo, {
+        'Gasto Médio no Grupo (R$)': FORMATO_MOEDA,
+        'Peso no Total (%)': FORMATO_PERCENTUAL,
+    })
+    relatorio.adicionar('Cesta_ate_Linha_Pobreza_Subitem', resultado.composicao_subitem, {
+        'Gasto Médio Subitem (R$)': FORMATO_MOEDA,
+        'Peso no Grupo (%)': FORMATO_PERCENTUAL,
+        'Peso no Total (%)': FORMATO_PERCENTUAL,
+    })
+    if resultado.bootstrap is not None:
+        relatorio.adicionar('Bootstrap_IC', resultado.bootstrap)
+    if resultado.sensibilidade is not None:
+        relatorio.adicionar('Sensibilidade', resultado.sensibilidade)
+    return relatorio
@@ -0,0 +1,116 @@
+"""
+Estatísticas ponderadas pelo fator de expansão da amostra.
+
+Cada estatística sai de uma única ordenação e das somas acumuladas dos pesos,
+sem replicar linhas. O quantil ponderado é o quantil linear (tipo 7, o padrão do
+pandas/NumPy) sobre a amostra expandida, com os pesos normalizados para média 1:
+a mesma definição de cesta_pof.bootstrap.quantil_linhas. Com pesos todos iguais
+os resultados coincidem com os não ponderados.
+"""
+import numpy as np
+
+# Tolerância relativa ao peso total na comparação das somas acumuladas com os postos
+TOLERANCIA_POSTO = 1e-9
+
+
+def normalizar_pesos(pesos, eixo=0):
+    """Pesos reescalados para média 1 ao longo do eixo (soma igual ao número de observações)."""
+    pesos = np.asarray(pesos, dtype=float)
+    if not np.isfinite(pesos).all() or (pesos < 0).any():
+        raise ValueError("Os pesos devem ser finitos e não negativos")
+    total = pesos.sum(axis=eixo, keepdims=True)
+    if (total <= 0).any():
+        raise ValueError("A soma dos pesos deve ser positiva")
+    return pesos * (pesos.shape[eixo] / total)
+
+
+def limiares_postos(total, quantis):
+    """
+    Postos da amostra expandida para o quantil linear: (limiar inferior, limiar superior, fração).
+
+    total é a soma dos pesos (normalizados para média 1). As observações i_inf e
+    i_sup são as primeiras cuja soma acumulada passa de cada limiar. As somas em
+    ponto flutuante ficam alguns ulps acima ou abaixo dos postos inteiros, por
+    isso a comparação tem uma folga relativa ao total.
+    """
+    tolerancia = TOLERANCIA_POSTO * total
+    h = quantis * (total - 1)
+    inferior = np.floor(h + tolerancia)
+    fracao = h - inferior
+    return inferior + tolerancia, inferior + 1 + tolerancia, np.where(fracao > tolerancia, fracao, 0.0)
+
+
+def quantis_ponderados_ordenados(ordenados, pesos_ordenados, quantis):
+    """Quantis ponderados de valores já ordenados, com os pesos na mesma ordem."""
+    quantis = np.asarray(quantis, dtype=float)
+    n = len(ordenados)
+    if not n:
+        return np.full(quantis.shape, np.nan)
+    acumulado = np.cumsum(normalizar_pesos(pesos_ordenados))
+    limiar_inf, limiar_sup, fracao = limiares_postos(acumulado[-1], quantis)
+    i_inf = np.minimum(np.searchsorted(acumulado, limiar_inf, side='right'), n - 1)
+    i_sup = np.minimum(np.searchsorted(acumulado, limiar_sup, side='right'), n - 1)
+    v_inf = ordenados[i_inf]
+    return v_inf + fracao * (ordenados[i_sup] - v_inf)
+
+
+def quantil_ponderado(valores, pesos, quantis):
+    """Quantis ponderados de valores em qualquer ordem."""
+    valores = np.asarray(valores, dtype=float)
+    ordem = np.argsort(valores, kind='stable')
+    return quantis_ponderados_ordenados(valores[ordem], np.asarray(pesos, dtype=float)[ordem], quantis)
+
+
+def mediana_ponderada(valores, pesos):
+    """Mediana ponderada (quantil 0,5)."""
+    return quantil_ponderado(valores, pesos, 0.5)
+
+
+def mad_ponderado(valores, pesos):
+    """(mediana ponderada, mediana ponderada dos desvios absolutos em relação a ela)."""
+    valores = np.asarray(valores, dtype=float)
+    mediana = mediana_ponderada(valores, pesos)
+    return mediana, mediana_ponderada(np.abs(valores - mediana), pesos)
+
+
+def proporcoes_ate_ponderadas(ordenados, pesos_ordenados, limiares):
+    """Parcela do peso com valor <= cada limiar (HCR ponderado), com valores já ordenados."""
+    if not len(ordenados):
+        return np.full(np.shape(limiares), np.nan)
+    acumulado = np.concatenate(([0.0], np.cumsum(pesos_ordenados, dtype=float)))
+    k = np.searchsorted(ordenados, limiares, side='right')
+    return acumulado[k] / acumulado[-1]
+
+
+def media_ponderada(valores, pesos):
+    """Média ponderada de cada coluna de `valores` (vetor ou matriz observações x colunas)."""
+    valores = np.asarray(valores, dtype=float)
+    pesos = np.asarray(pesos, dtype=float)
+    total = pesos.sum()
+    if total <= 0:
+        return np.full(valores.shape[1:], np.nan) if valores.ndim > 1 else np.nan
+    return pesos @ valores / total
+
+
+def quantis_colunas(ordenados, pesos_ordenados, quantil, validos=None):
+    """
+    Quantil ponderado de cada coluna de uma matriz já ordenada por coluna.
+
+    validos é o número de observações de cada coluna, que ficam no início da
+    ordenação (padrão: as de peso positivo); as demais têm peso 0 e não contam.
+    Colunas sem observações resultam em NaN.
+    """
+    colunas = ordenados.shape[1]
+    if validos is None:
+        validos = (pesos_ordenados > 0).sum(axis=0)
+    acumulado = np.cumsum(pesos_ordenados, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        acumulado = acumulado * (validos / acumulado[-1])
+        limiar_inf, limiar_sup, fracao = limiares_postos(acumulado[-1], quantil)
+    ultimo = np.maximum(validos - 1, 0)
+    i_inf = np.minimum((acumulado <= limiar_inf).sum(axis=0), ultimo)
+    i_sup = np.minimum((acumulado <= limiar_sup).sum(axis=0), ultimo)
+    indice = np.arange(colunas)
+    v_inf = ordenados[i_inf, indice]
+    resultado = v_inf + fracao * (ordenados[i_sup, indice] - v_inf)
+    return np.where(validos > 0, resultado, np.nan)
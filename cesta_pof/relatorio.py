@@ -0,0 +1,116 @@
+"""
+Relatório consolidado: coleta as tabelas de resultado e grava tudo de uma vez.
+
+O Excel é escrito em uma única passada, linha a linha, com um motor de escrita
+sequencial (xlsxwriter em modo constant_memory ou, na falta dele, o modo
+write_only do openpyxl). As células são numéricas; percentuais e valores
+monetários recebem apenas formato de exibição. As mesmas tabelas podem ser
+exportadas em Parquet ou CSV para outros sistemas.
+"""
+import math
+import os
+import re
+
+FORMATO_PERCENTUAL = '0.00%'
+FORMATO_DUAS_CASAS = '0.00'
+FORMATO_MOEDA = '"R$" #,##0.00'
+
+
+def _valores_linhas(df):
+    # Linhas com tipos nativos do Python; NaN/inf viram células vazias
+    colunas = [df[c].tolist() for c in df.columns]
+    for linha in zip(*colunas):
+        yield [None if isinstance(v, float) and not math.isfinite(v) else v for v in linha]
+
+
+def nome_arquivo(aba):
+    """Nome de arquivo seguro para a aba (ex.: 'Comparacao_Faixa_±20%' -> 'Comparacao_Faixa_20')."""
+    return re.sub(r'_+', '_', re.sub(r'[^0-9A-Za-z_-]+', '_', aba)).strip('_') or 'tabela'
+
+
+class Relatorio:
+    """Coleção ordenada de tabelas (aba -> DataFrame) com formatos de exibição por coluna."""
+
+    def __init__(self):
+        self.tabelas = {}
+        self.formatos = {}
+
+    def adicionar(self, aba, df, formatos=None):
+        """Inclui (ou substitui) a tabela da aba. formatos: {coluna: formato numérico do Excel}."""
+        if len(aba) > 31:
+            raise ValueError(f"Nome de aba com mais de 31 caracteres: '{aba}'")
+        self.tabelas[aba] = df
+        self.formatos[aba] = dict(formatos or {})
+        return self
+
+    def __len__(self):
+        return len(self.tabelas)
+
+    def salvar_excel(self, caminho):
+        """Grava todas as abas em um único arquivo, em uma passada."""
+        try:
+            import xlsxwriter  # noqa: F401
+        except ImportError:
+            self._salvar_openpyxl(caminho)
+        else:
+            self._salvar_xlsxwriter(caminho)
+
+    def _salvar_xlsxwriter(self, caminho):
+        import xlsxwriter
+
+        livro = xlsxwriter.Workbook(caminho, {'constant_memory': True})
+        try:
+            negrito = livro.add_format({'bold': True})
+            estilos = {}
+            for aba, df in self.tabelas.items():
+                planilha = livro.add_worksheet(aba)
+                for i, coluna in enumerate(df.columns):
+                    formato = self.formatos[aba].get(coluna)
+                    if formato is not None and formato not in estilos:
+                        estilos[formato] = livro.add_format({'num_format': formato})
+                    planilha.set_column(i, i, max(12, len(str(coluna)) + 2), estilos.get(formato))
+                planilha.write_row(0, 0, [str(c) for c in df.columns], negrito)
+                for i, linha in enumerate(_valores_linhas(df), start=1):
+                    planilha.write_row(i, 0, linha)
+        finally:
+            livro.close()
+
+    def _salvar_openpyxl(self, caminho):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font
+
+        livro = Workbook(write_only=True)
+        for aba, df in self.tabelas.items():
+            planilha = livro.create_sheet(aba)
+            cabecalho = []
+            for coluna in df.columns:
+                celula = WriteOnlyCell(planilha, value=str(coluna))
+                celula.font = Font(bold=True)
+                cabecalho.append(celula)
+            planilha.append(cabecalho)
+            formatos = [self.formatos[aba].get(coluna) for coluna in df.columns]
+            for linha in _valores_linhas(df):
+                celulas = []
+                for valor, formato in zip(linha, formatos):
+                    celula = WriteOnlyCell(planilha, value=valor)
+                    if formato is not None:
+                        celula.number_format = formato
+                    celulas.append(celula)
+                planilha.append(celulas)
+        livro.save(caminho)
+
+    def salvar_tabelas(self, diretorio, formato='parquet'):
+        """Grava cada tabela em um arquivo Parquet ou CSV no diretório. Retorna os caminhos."""
+        if formato not in ('parquet', 'csv'):
+            raise ValueError(f"Formato de exportação desconhecido: '{formato}'")
+        os.makedirs(diretorio, exist_ok=True)
+        caminhos = []
+        for aba, df in self.tabelas.items():
+            caminho = os.path.join(diretorio, f'{nome_arquivo(aba)}.{formato}')
+            if formato == 'parquet':
+                df.to_parquet(caminho, index=False)
+            else:
+                df.to_csv(caminho, index=False)
+            caminhos.append(caminho)
+        return caminhos
@@ -0,0 +1,109 @@
+"""
+Análise de sensibilidade sobre a distribuição acumulada (ECDF) do gasto.
+
+O gasto dos domicílios é ordenado uma única vez; a proporção até qualquer conjunto
+de linhas sai de um np.searchsorted. A varredura percorre a grade cartesiana
+deflator x quantil x multiplicador do MAD x cesta: como o gasto real e o log são
+monótonos no gasto nominal, o corte de outliers é um intervalo contíguo do vetor
+ordenado e o quantil e os HCRs de cada cenário custam O(log n). Com o fator de
+expansão no agregado base, os pesos seguem a mesma ordenação e mediana, MAD,
+quantis e proporções saem das somas acumuladas dos pesos.
+"""
+import numpy as np
+import pandas as pd
+
+from cesta_pof.cestas import FATOR_DEFLACAO, FATOR_SIGMA_MAD, MULTIPLICADOR_MAD, QUANTIL_POBREZA, cesta_por_grupo
+from cesta_pof.indicadores import fgt_intervalo, somas_prefixo
+from cesta_pof.ponderado import mediana_ponderada, proporcoes_ate_ponderadas, quantis_ponderados_ordenados
+
+
+def proporcoes_ate(valores_ordenados, limiares):
+    """Proporção dos valores (já ordenados) <= cada limiar, equivalente a (serie <= limiar).mean()."""
+    if not len(valores_ordenados):
+        return np.full(np.shape(limiares), np.nan)
+    return np.searchsorted(valores_ordenados, limiares, side='right') / len(valores_ordenados)
+
+
+def quantis_ordenados(valores_ordenados, quantis):
+    """Quantis lineares (o padrão do pandas) de um vetor já ordenado."""
+    quantis = np.asarray(quantis, dtype=float)
+    n = len(valores_ordenados)
+    if not n:
+        return np.full(quantis.shape, np.nan)
+    h = quantis * (n - 1)
+    inferior = np.floor(h).astype(np.int64)
+    superior = np.minimum(inferior + 1, n - 1)
+    v_inf = valores_ordenados[inferior]
+    return v_inf + (h - inferior) * (valores_ordenados[superior] - v_inf)
+
+
+def _gasto_nominal_ordenado(base, excluir):
+    # (gasto nominal ordenado, fator de expansão na mesma ordem ou None)
+    agregado, _ = cesta_por_grupo(base, excluir)
+    nominal = agregado.sum(axis=1).to_numpy(dtype=float)
+    if base.fator_expansao is None:
+        return np.sort(nominal), None
+    ordem = np.argsort(nominal, kind='stable')
+    return nominal[ordem], base.fator_expansao.reindex(agregado.index).to_numpy()[ordem]
+
+
+def varredura(base, variantes, fatores_deflacao=(FATOR_DEFLACAO,), quantis=(QUANTIL_POBREZA,),
+              multiplicadores_mad=(MULTIPLICADOR_MAD,)):
+    """
+    Linha de pobreza, HCR (real e nominal, em %), P1, P2 (em %) e Watts do gasto
+    real para cada cenário da grade.
+
+    variantes é {nome da cesta: subitens excluídos}, como em calcular_cestas.
+    Com o fator de expansão no agregado base, todas as estatísticas são
+    ponderadas. Retorna um DataFrame com uma linha por cenário.
+    """
+    quantis = np.asarray(quantis, dtype=float)
+    q = len(quantis)
+    total = len(variantes) * len(fatores_deflacao) * len(multiplicadores_mad) * q
+    # Resultados preenchidos por fatias de q linhas: um único DataFrame no fim, não um por cenário
+    metricas = ['linha_pobreza', 'HCR_adj (%)', 'HCR (%)', 'P1_adj (%)', 'P2_adj (%)', 'Watts_adj']
+    valores = {nome: np.empty(total) for nome in metricas}
+    cenarios = {'cesta': [], 'fator_deflacao': [], 'multiplicador_mad': [], 'domicilios': []}
+    for nome, excluir in variantes.items():
+        nominal, pesos = _gasto_nominal_ordenado(base, excluir)
+        for fator in fatores_deflacao:
+            real = nominal / fator
+            log_real = np.log(real + 1)
+            if pesos is None:
+                mediana = np.median(log_real)
+                sigma_mad = FATOR_SIGMA_MAD * np.median(np.abs(log_real - mediana))
+            else:
+                mediana = quantis_ponderados_ordenados(log_real, pesos, 0.5)
+                sigma_mad = FATOR_SIGMA_MAD * mediana_ponderada(np.abs(log_real - mediana), pesos)
+            somas = somas_prefixo(real, pesos)
+            for multiplicador in multiplicadores_mad:
+                # Domicílios dentro dos limites formam o trecho [inicio, fim) do vetor ordenado
+                inicio = np.searchsorted(log_real, mediana - multiplicador * sigma_mad, side='left')
+                fim = np.searchsorted(log_real, mediana + multiplicador * sigma_mad, side='right')
+                real_final = real[inicio:fim]
+                if pesos is None:
+                    linhas = quantis_ordenados(real_final, quantis)
+                    hcr_adj = proporcoes_ate(real_final, linhas)
+                    hcr = proporcoes_ate(nominal[inicio:fim], linhas)
+                else:
+                    pesos_final = pesos[inicio:fim]
+                    linhas = quantis_ponderados_ordenados(real_final, pesos_final, quantis)
+                    hcr_adj = proporcoes_ate_ponderadas(real_final, pesos_final, linhas)
+                    hcr = proporcoes_ate_ponderadas(nominal[inicio:fim], pesos_final, linhas)
+                _, p1, p2, watts = fgt_intervalo(real, somas, linhas, inicio, fim)
+
+                fatia = slice(len(cenarios['cesta']) * q, (len(cenarios['cesta']) + 1) * q)
+                for coluna, valor in (('cesta', nome), ('fator_deflacao', fator),
+                                      ('multiplicador_mad', multiplicador), ('domicilios', fim - inicio)):
+                    cenarios[coluna].append(valor)
+                for coluna, valor in zip(metricas, (linhas, hcr_adj * 100, hcr * 100, p1 * 100, p2 * 100, watts)):
+                    valores[coluna][fatia] = valor
+    repetidos = {coluna: np.repeat(np.asarray(lista), q) for coluna, lista in cenarios.items()}
+    return pd.DataFrame({
+        'cesta': repetidos['cesta'],
+        'fator_deflacao': repetidos['fator_deflacao'],
+        'quantil': np.tile(quantis, len(cenarios['cesta'])),
+        'multiplicador_mad': repetidos['multiplicador_mad'],
+        'domicilios': repetidos['domicilios'],
+        **valores,
+    })
@@ -0,0 +1,391 @@
+"""
+Serviço local de consultas para recalcular a linha de pobreza interativamente.
+
+Os microdados são lidos e agregados uma única vez (em blocos, uma passada para
+todas as UFs) e os agregados por domicílio ficam em memória. Cada consulta só
+refaz a cesta: exclusões, deflação, corte de MAD e quantil, o que leva
+milissegundos. As respostas ficam guardadas por parâmetros; se o CSV mudar
+(data de modificação ou tamanho), agregados e respostas são descartados e o
+arquivo é lido de novo na consulta seguinte.
+
+O servidor é HTTP/1.1 mínimo sobre asyncio (só biblioteca padrão), em uma porta
+local ou em um socket Unix. Os cálculos rodam em threads, então clientes
+simultâneos não esperam uns pelos outros.
+
+Rotas (respostas em JSON):
+    GET  /estado                          arquivo, UFs carregadas e contadores
+    GET  /linha?uf=26&deflator=0.94&quantil=0.35&multiplicador_mad=3&cesta=Refinada
+         (ou &excluir=1201009,3101002)    linha, tabela de HCR e pesos dos grupos
+    POST /avaliar  {"uf": 26, "conjuntos": {"nome": [códigos]}, ...}
+                                          linha e HCR de várias listas de exclusão
+
+Uso:
+    python -m cesta_pof.servico Consume_Basket_DRP/POF2018.csv --porta 8765
+    curl 'http://127.0.0.1:8765/linha?uf=26&deflator=0.92'
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from cesta_pof.cestas import CESTAS_PADRAO, FATOR_DEFLACAO, MULTIPLICADOR_MAD, QUANTIL_POBREZA, calcular_cesta
+from cesta_pof.incremental import agregar_por_uf
+from cesta_pof.pipeline import CESTA_REFERENCIA, tabela_real_vs_nominal
+
+HOST_PADRAO = '127.0.0.1'
+PORTA_PADRAO = 8765
+# Respostas guardadas por parâmetros (as mais antigas saem primeiro)
+LIMITE_RESPOSTAS = 1024
+TAMANHO_MAXIMO_CORPO = 16 << 20
+
+_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class ErroConsulta(Exception):
+    """Erro na consulta do cliente; vira uma resposta com o status indicado."""
+
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def _assinatura(caminho):
+    # Identifica a versão do arquivo sem lê-lo
+    info = os.stat(caminho)
+    return info.st_mtime_ns, info.st_size
+
+
+def _numero(valores, nome, padrao, tipo=float):
+    if nome not in valores:
+        return padrao
+    try:
+        valor = tipo(valores[nome])
+    except (TypeError, ValueError):
+        raise ErroConsulta(f"Parâmetro '{nome}' inválido: {valores[nome]!r}") from None
+    # nan e inf passariam pelas comparações de faixa e dariam linhas degeneradas
+    if not math.isfinite(valor):
+        raise ErroConsulta(f"Parâmetro '{nome}' inválido: {valores[nome]!r}")
+    return valor
+
+
+def _codigos(valor):
+    if isinstance(valor, str):
+        valor = valor.replace(',', ' ').split()
+    try:
+        return tuple(sorted({int(c) for c in valor}))
+    except (TypeError, ValueError):
+        raise ErroConsulta(f"Lista de subitens inválida: {valor!r}") from None
+
+
+def parametros_consulta(valores):
+    """Normaliza os parâmetros de uma consulta (query string ou JSON) em uma tupla usável como chave."""
+    if 'uf' not in valores:
+        raise ErroConsulta("Parâmetro 'uf' é obrigatório")
+    uf = _numero(valores, 'uf', None, int)
+    if 'excluir' in valores:
+        excluir = _codigos(valores['excluir'])
+    else:
+        cesta = valores.get('cesta', CESTA_REFERENCIA)
+        if cesta not in CESTAS_PADRAO:
+            raise ErroConsulta(f"Cesta desconhecida: {cesta!r} (use {', '.join(CESTAS_PADRAO)} ou 'excluir')")
+        excluir = _codigos(CESTAS_PADRAO[cesta])
+    fator = _numero(valores, 'deflator', FATOR_DEFLACAO)
+    quantil = _numero(valores, 'quantil', QUANTIL_POBREZA)
+    multiplicador = _numero(valores, 'multiplicador_mad', MULTIPLICADOR_MAD)
+    if fator <= 0 or not 0 <= quantil <= 1 or multiplicador <= 0:
+        raise ErroConsulta("Use deflator > 0, 0 <= quantil <= 1 e multiplicador_mad > 0")
+    return uf, excluir, fator, quantil, multiplicador
+
+
+class Servico:
+    """Agregados em memória de um CSV da POF e as consultas sobre eles."""
+
+    def __init__(self, caminho, ufs=None, limite_respostas=LIMITE_RESPOSTAS):
+        self.caminho = caminho
+        self.ufs = ufs
+        self.limite_respostas = limite_respostas
+        self.bases = {}
+        self.assinatura = None
+        self.carregado_em = None
+        self.segundos_carga = None
+        self.consultas = 0
+        self.acertos = 0
+        self._respostas = {}
+        self._matrizes = {}
+        self._trava = threading.Lock()
+        self._trava_respostas = threading.Lock()
+
+    def atualizar(self):
+        """Relê o arquivo se ele mudou desde a última carga. Retorna True se recarregou."""
+        with self._trava:
+            try:
+                assinatura = _assinatura(self.caminho)
+            except FileNotFoundError:
+                raise ErroConsulta(f"Arquivo '{self.caminho}' não encontrado", 500) from None
+            if assinatura == self.assinatura:
+                return False
+            inicio = time.perf_counter()
+            bases = agregar_por_uf(self.caminho, self.ufs)
+            # O arquivo pode ter mudado durante a leitura: vale a assinatura anterior à leitura
+            self.bases, self.assinatura, self._respostas, self._matrizes = bases, assinatura, {}, {}
+            self.segundos_carga = time.perf_counter() - inicio
+            self.carregado_em = time.strftime('%Y-%m-%dT%H:%M:%S')
+            return True
+
+    def _base(self, uf):
+        # (agregado da UF, assinatura do arquivo de onde ele veio), lidos juntos
+        self.atualizar()
+        with self._trava:
+            bases, assinatura = self.bases, self.assinatura
+        if uf not in bases:
+            raise ErroConsulta(f"UF {uf} sem registros em '{self.caminho}'", 404)
+        return bases[uf], assinatura
+
+    def _memo(self, assinatura, chave_resposta, funcao):
+        # O cálculo fica fora da trava: consultas diferentes rodam em paralelo
+        chave_resposta = (assinatura, chave_resposta)
+        with self._trava_respostas:
+            self.consultas += 1
+            resposta = self._respostas.get(chave_resposta)
+            if resposta is not None:
+                self.acertos += 1
+                return resposta
+        resposta = funcao()
+        with self._trava_respostas:
+            # Uma recarga durante o cálculo: a resposta é da versão anterior e não é guardada
+            if assinatura == self.assinatura:
+                while len(self._respostas) >= self.limite_respostas:
+                    self._respostas.pop(next(iter(self._respostas)))
+                self._respostas[chave_resposta] = resposta
+        return resposta
+
+    def _matriz(self, uf, base, assinatura):
+        # Matriz esparsa da UF, guardada à parte das respostas e descartada na recarga
+        from cesta_pof.matriz import matriz_subitens
+
+        with self._trava_respostas:
+            matriz = self._matrizes.get((assinatura, uf))
+        if matriz is None:
+            matriz = matriz_subitens(base)
+            with self._trava_respostas:
+                if assinatura == self.assinatura:
+                    self._matrizes[(assinatura, uf)] = matriz
+        return matriz
+
+    def estado(self):
+        """Arquivo, UFs em memória e contadores de consultas."""
+        try:
+            alterado = _assinatura(self.caminho) != self.assinatura
+        except FileNotFoundError:
+            alterado = True
+        return {
+            'arquivo': self.caminho,
+            'arquivo_alterado': alterado,
+            'carregado_em': self.carregado_em,
+            'segundos_carga': self.segundos_carga,
+            'ufs': {uf: len(base.por_grupo) for uf, base in self.bases.items()},
+            'consultas': self.consultas,
+            'respostas_em_memoria': len(self._respostas),
+            'matrizes_em_memoria': len(self._matrizes),
+            'acertos': self.acertos,
+        }
+
+    def linha(self, valores):
+        """Linha de pobreza, tabela de HCR e pesos dos grupos da UF com os parâmetros da consulta."""
+        uf, excluir, fator, quantil, multiplicador = parametros = parametros_consulta(valores)
+        base, assinatura = self._base(uf)
+
+        def _calcular():
+            cesta = calcular_cesta(base, 'consulta', excluir, fator, quantil, multiplicador)
+            tabela = tabela_real_vs_nominal(cesta.df_final, cesta.linha_pobreza, quantil=quantil)
+            return {
+                'uf': uf,
+                'deflator': fator,
+                'quantil': quantil,
+                'multiplicador_mad': multiplicador,
+                'subitens_excluidos': len(excluir),
+                'domicilios': len(cesta.df_final),
+                'descartadas_mad': len(cesta.df_agregado) - len(cesta.df_final),
+                'limites_mad': list(cesta.limites_mad),
+                'linha_pobreza': cesta.linha_pobreza,
+                'pesos': cesta.pesos.to_dict(),
+                'tabela_hcr': tabela.to_dict(orient='records'),
+            }
+        return self._memo(assinatura, ('linha', parametros), _calcular)
+
+    def avaliar(self, valores):
+        """Linha e HCR de cada lista de exclusão em valores['conjuntos'] (cesta_pof.matriz)."""
+        from cesta_pof.matriz import avaliar_exclusoes
+
+        conjuntos = valores.get('conjuntos')
+        if not isinstance(conjuntos, (dict, list)) or not conjuntos:
+            raise ErroConsulta("'conjuntos' deve ser um objeto {nome: [códigos]} ou uma lista de listas")
+        if isinstance(conjuntos, list):
+            conjuntos = dict(enumerate(conjuntos))
+        conjuntos = {str(nome): _codigos(excluir) for nome, excluir in conjuntos.items()}
+        referencia = _codigos(valores.get('referencia', ()))
+        uf, _, fator, quantil, multiplicador = parametros_consulta({**valores, 'excluir': ()})
+        base, assinatura = self._base(uf)
+        matriz = self._matriz(uf, base, assinatura)
+        tabela = avaliar_exclusoes(matriz, conjuntos, fator, quantil, multiplicador, referencia=referencia)
+        return {'uf': uf, 'resultados': tabela.to_dict(orient='records')}
+
+
+def _para_json(valor):
+    """Estrutura com tipos nativos do Python; escalares do NumPy viram números e NaN/inf viram null."""
+    if isinstance(valor, dict):
+        return {_para_json(chave): _para_json(item) for chave, item in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_para_json(item) for item in valor]
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    return valor
+
+
+def _resposta_http(status, corpo, manter):
+    dados = json.dumps(_para_json(corpo), ensure_ascii=False, allow_nan=False).encode('utf-8')
+    cabecalho = (
+        f"HTTP/1.1 {status} {_STATUS[status]}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(dados)}\r\n"
+        f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n"
+    )
+    return cabecalho.encode('latin-1') + dados
+
+
+async def _ler_requisicao(leitor):
+    # (método, alvo, cabeçalhos, corpo), ou None se o cliente fechou a conexão
+    linha = await leitor.readline()
+    if not linha.strip():
+        return None
+    try:
+        metodo, alvo, _ = linha.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise ErroConsulta("Requisição HTTP inválida") from None
+    cabecalhos = {}
+    while True:
+        linha = await leitor.readline()
+        if linha in (b'\r\n', b'\n', b''):
+            break
+        nome, _, valor = linha.decode('latin-1').partition(':')
+        cabecalhos[nome.strip().lower()] = valor.strip()
+    valor = cabecalhos.get('content-length', '') or '0'
+    if not (valor.isascii() and valor.isdigit()):
+        raise ErroConsulta(f"Content-Length inválido: {valor!r}")
+    tamanho = int(valor)
+    if tamanho > TAMANHO_MAXIMO_CORPO:
+        raise ErroConsulta("Corpo da requisição muito grande", 413)
+    corpo = await leitor.readexactly(tamanho) if tamanho else b''
+    return metodo.upper(), alvo, cabecalhos, corpo
+
+
+def _despachar(servico, metodo, alvo, corpo):
+    partes = urlsplit(alvo)
+    valores = {nome: lista[-1] for nome, lista in parse_qs(partes.query).items()}
+    rotas = {'/estado': ('GET', servico.estado),
+             '/linha': ('GET', lambda: servico.linha(valores)),
+             '/avaliar': ('POST', lambda: servico.avaliar(_json_corpo(corpo, valores)))}
+    if partes.path not in rotas:
+        raise ErroConsulta(f"Rota desconhecida: {partes.path}", 404)
+    esperado, funcao = rotas[partes.path]
+    if metodo != esperado:
+        raise ErroConsulta(f"Use {esperado} em {partes.path}", 405)
+    return funcao()
+
+
+def _json_corpo(corpo, valores):
+    try:
+        dados = json.loads(corpo or b'{}')
+    except ValueError:
+        raise ErroConsulta("Corpo JSON inválido") from None
+    if not isinstance(dados, dict):
+        raise ErroConsulta("O corpo deve ser um objeto JSON")
+    return {**valores, **dados}
+
+
+def tratador(servico):
+    """Corrotina de conexão para asyncio.start_server / start_unix_server."""
+    async def _tratar(leitor, escritor):
+        laco = asyncio.get_running_loop()
+        try:
+            while True:
+                manter = False
+                try:
+                    requisicao = await _ler_requisicao(leitor)
+                    if requisicao is None:
+                        break
+                    metodo, alvo, cabecalhos, corpo = requisicao
+                    manter = cabecalhos.get('connection', '').lower() != 'close'
+                    # Os cálculos rodam fora do laço de eventos
+                    status, resposta = 200, await laco.run_in_executor(
+                        None, _despachar, servico, metodo, alvo, corpo)
+                except ErroConsulta as erro:
+                    status, resposta = erro.status, {'erro': str(erro)}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as erro:
+                    status, resposta = 500, {'erro': f"{type(erro).__name__}: {erro}"}
+                escritor.write(_resposta_http(status, resposta, manter))
+                await escritor.drain()
+                if not manter:
+                    break
+        finally:
+            escritor.close()
+    return _tratar
+
+
+async def servir(servico, host=HOST_PADRAO, porta=PORTA_PADRAO, socket_unix=None, pronto=None):
+    """Atende até ser cancelado. `pronto`, se informado, é chamado com o servidor já escutando."""
+    if socket_unix:
+        servidor = await asyncio.start_unix_server(tratador(servico), path=socket_unix)
+    else:
+        servidor = await asyncio.start_server(tratador(servico), host, porta)
+    if pronto is not None:
+        pronto(servidor)
+    async with servidor:
+        await servidor.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço local de consultas da linha de pobreza.")
+    parser.add_argument('entrada', help="CSV com os registros de despesa da POF")
+    parser.add_argument('--host', default=HOST_PADRAO)
+    parser.add_argument('--porta', type=int, default=PORTA_PADRAO)
+    parser.add_argument('--socket', help="escuta neste socket Unix em vez da porta TCP")
+    parser.add_argument('--ufs', type=int, nargs='+', help="mantém em memória só as UFs indicadas")
+    args = parser.parse_args(argv)
+
+    servico = Servico(args.entrada, ufs=args.ufs)
+    try:
+        servico.atualizar()
+    except FileNotFoundError as erro:
+        print(f"Arquivo '{erro.filename}' não encontrado.", file=sys.stderr)
+        return 1
+    except (ErroConsulta, OSError) as erro:
+        print(f"{erro}.", file=sys.stderr)
+        return 1
+    print(f"{len(servico.bases)} UFs carregadas em {servico.segundos_carga:.2f}s.")
+
+    def _pronto(servidor):
+        onde = args.socket or f"http://{args.host}:{args.porta}"
+        print(f"Atendendo em {onde} (Ctrl+C encerra).")
+
+    try:
+        asyncio.run(servir(servico, args.host, args.porta, args.socket, pronto=_pronto))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
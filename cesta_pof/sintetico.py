@@ -0,0 +1,168 @@
+"""
+Gerador de registros de despesa sintéticos no formato da POF.
+
+Produz as colunas lidas pela ingestão (uf, domicilio, cod_subitem, subitem,
+gasto) mais o fator de expansão do domicílio (peso_final), com códigos de
+subitem de 7 dígitos nos prefixos do esquema de grupos (incluindo os subitens
+da lista de Mancini), popularidade dos subitens em lei de potência e gasto com
+cauda pesada (lognormal por domicílio x subitem com uma fração de valores
+Pareto). A geração é feita em blocos, de 100 mil a dezenas de milhões de
+linhas, sem manter o arquivo inteiro em memória.
+
+Uso:
+    python -m cesta_pof.sintetico pof_sintetica.csv --linhas 1000000
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from cesta_pof.cestas import ITENS_EXCLUIDOS_MANCINI
+from cesta_pof.classificacao import carregar_esquema
+from cesta_pof.ingestao import COLUNA_PESO_PADRAO, COLUNAS_POF, TAMANHO_BLOCO_PADRAO
+
+# População aproximada das UFs em 2018 (milhões), usada para sortear a UF do domicílio
+POPULACAO_UF = {
+    11: 1.76, 12: 0.87, 13: 4.08, 14: 0.58, 15: 8.51, 16: 0.83, 17: 1.56,
+    21: 7.04, 22: 3.26, 23: 9.08, 24: 3.48, 25: 3.99, 26: 9.50, 27: 3.32, 28: 2.28, 29: 14.81,
+    31: 21.04, 32: 3.97, 33: 17.16, 35: 45.54,
+    41: 11.35, 42: 7.08, 43: 11.33,
+    50: 2.75, 51: 3.44, 52: 6.92, 53: 2.97,
+}
+
+REGISTROS_POR_DOMICILIO = 40
+SUBGRUPOS_POR_PREFIXO = 3
+ITENS_POR_SUBGRUPO = 40
+FRACAO_CAUDA = 0.02
+ALFA_PARETO = 1.5
+# Gasto típico (R$) por registro na primeira posição do prefixo (11 = alimentação, 21 = habitação ...)
+GASTO_TIPICO_PREFIXO = {1: 25.0, 2: 50.0, 3: 50.0, 4: 35.0, 5: 50.0, 6: 30.0, 7: 25.0, 8: 45.0, 9: 20.0}
+# Frequência relativa de registros (alimentação é comprada com muito mais frequência)
+FREQUENCIA_PREFIXO = {1: 4.0}
+# Fator de expansão médio; domicílios de gasto menor representam mais domicílios
+PESO_MEDIO = 300.0
+ELASTICIDADE_PESO = -0.5
+
+
+def catalogo_subitens(esquema=None, semente=0):
+    """
+    Catálogo de subitens: cod_subitem, subitem, popularidade (soma 1) e log do gasto típico.
+
+    Os códigos são prefixo * 100000 + subgrupo * 1000 + item para todo prefixo
+    coberto pelo esquema, mais os subitens excluídos da cesta refinada.
+    """
+    if esquema is None:
+        esquema = carregar_esquema()
+    elif not isinstance(esquema, pd.DataFrame):
+        esquema = pd.DataFrame(list(esquema), columns=['prefixo_inicial', 'prefixo_final', 'nome_grupo'])
+    rng = np.random.default_rng(semente)
+    prefixos = sorted({p for a, b in zip(esquema['prefixo_inicial'], esquema['prefixo_final']) for p in range(a, b + 1)})
+    codigos = [
+        p * 100000 + subgrupo * 1000 + item
+        for p in prefixos
+        for subgrupo in range(1, SUBGRUPOS_POR_PREFIXO + 1)
+        for item in range(1, ITENS_POR_SUBGRUPO + 1)
+    ]
+    codigos = np.unique(np.concatenate([codigos, ITENS_EXCLUIDOS_MANCINI])).astype(np.int32)
+
+    # Popularidade em lei de potência, em ordem aleatória entre os códigos
+    popularidade = 1.0 / np.arange(1, len(codigos) + 1) ** 1.1
+    popularidade = rng.permutation(popularidade)
+    popularidade *= np.array([FREQUENCIA_PREFIXO.get(int(c) // 1000000, 1.0) for c in codigos])
+    tipico = np.array([GASTO_TIPICO_PREFIXO.get(int(c) // 1000000, 20.0) for c in codigos])
+    return pd.DataFrame({
+        'cod_subitem': codigos,
+        'subitem': [f'SUBITEM {c}' for c in codigos],
+        'popularidade': popularidade / popularidade.sum(),
+        'log_gasto': np.log(tipico) + rng.normal(0, 0.5, len(codigos)),
+    })
+
+
+def gerar_bloco(rng, n_linhas, catalogo, primeiro_domicilio, ufs=None,
+                registros_por_domicilio=REGISTROS_POR_DOMICILIO):
+    """
+    Um bloco de n_linhas registros; os domicílios são numerados a partir de primeiro_domicilio.
+
+    Retorna (bloco, próximo número de domicílio livre).
+    """
+    if ufs is None:
+        ufs = POPULACAO_UF
+    codigos_uf = np.fromiter(ufs, dtype=np.int8)
+    prob_uf = np.asarray([ufs[u] for u in ufs], dtype=float)
+    prob_uf /= prob_uf.sum()
+
+    # Domicílios suficientes para cobrir o bloco; o último pode ficar com menos registros
+    estimativa = n_linhas // registros_por_domicilio + 1
+    registros = rng.poisson(registros_por_domicilio - 1, estimativa) + 1
+    while registros.sum() < n_linhas:
+        registros = np.concatenate([registros, rng.poisson(registros_por_domicilio - 1, estimativa) + 1])
+    fim = np.searchsorted(np.cumsum(registros), n_linhas) + 1
+    registros = registros[:fim]
+    n_domicilios = len(registros)
+
+    domicilios = np.arange(primeiro_domicilio, primeiro_domicilio + n_domicilios, dtype=np.int64)
+    uf_domicilio = rng.choice(codigos_uf, n_domicilios, p=prob_uf)
+    # Nível de gasto do domicílio (lognormal) que multiplica todos os seus registros
+    nivel_domicilio = rng.normal(0, 0.7, n_domicilios)
+
+    dom = np.repeat(np.arange(n_domicilios), registros)[:n_linhas]
+    item = rng.choice(len(catalogo), n_linhas, p=catalogo['popularidade'].to_numpy())
+    log_gasto = catalogo['log_gasto'].to_numpy()[item] + nivel_domicilio[dom] + rng.normal(0, 1.0, n_linhas)
+    gasto = np.exp(log_gasto)
+    cauda = rng.random(n_linhas) < FRACAO_CAUDA
+    gasto[cauda] *= rng.pareto(ALFA_PARETO, cauda.sum()) + 1
+
+    bloco = pd.DataFrame({
+        'uf': uf_domicilio[dom],
+        'domicilio': domicilios[dom],
+        'cod_subitem': catalogo['cod_subitem'].to_numpy()[item],
+        'subitem': pd.Categorical.from_codes(item, catalogo['subitem']),
+        'gasto': np.round(gasto, 2),
+        # Derivado do nível já sorteado: não altera a sequência aleatória dos registros
+        COLUNA_PESO_PADRAO: np.round(PESO_MEDIO * np.exp(ELASTICIDADE_PESO * nivel_domicilio), 2)[dom],
+    })
+    return bloco, primeiro_domicilio + n_domicilios
+
+
+def gerar_blocos(n_linhas, tamanho_bloco=TAMANHO_BLOCO_PADRAO, semente=None, ufs=None, esquema=None):
+    """Gera os registros em blocos (DataFrames com COLUNAS_POF e o fator de expansão) até somar n_linhas."""
+    rng = np.random.default_rng(semente)
+    catalogo = catalogo_subitens(esquema, semente=0 if semente is None else semente)
+    proximo = 100000
+    restantes = n_linhas
+    while restantes > 0:
+        tamanho = min(tamanho_bloco, restantes)
+        bloco, proximo = gerar_bloco(rng, tamanho, catalogo, proximo, ufs)
+        restantes -= tamanho
+        yield bloco[COLUNAS_POF + [COLUNA_PESO_PADRAO]]
+
+
+def gerar_registros(n_linhas, semente=None, ufs=None, esquema=None):
+    """Registros sintéticos em memória (para tamanhos que cabem em um DataFrame)."""
+    return pd.concat(list(gerar_blocos(n_linhas, semente=semente, ufs=ufs, esquema=esquema)), ignore_index=True)
+
+
+def gerar_csv(caminho, n_linhas, tamanho_bloco=TAMANHO_BLOCO_PADRAO, semente=None, ufs=None, esquema=None):
+    """Grava n_linhas registros sintéticos em CSV, bloco a bloco. Retorna o caminho."""
+    with open(caminho, 'w', newline='') as f:
+        for i, bloco in enumerate(gerar_blocos(n_linhas, tamanho_bloco, semente, ufs, esquema)):
+            bloco.to_csv(f, header=(i == 0), index=False, float_format='%.2f')
+    return caminho
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera registros de despesa sintéticos no formato da POF.")
+    parser.add_argument('saida', help="CSV de saída")
+    parser.add_argument('--linhas', type=int, default=1_000_000, help="número de registros (ex.: 100000 a 50000000)")
+    parser.add_argument('--tamanho-bloco', type=int, default=TAMANHO_BLOCO_PADRAO)
+    parser.add_argument('--ufs', type=int, nargs='+', help="restringe às UFs indicadas")
+    parser.add_argument('--semente', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    ufs = {uf: POPULACAO_UF.get(uf, 1.0) for uf in args.ufs} if args.ufs else None
+    gerar_csv(args.saida, args.linhas, args.tamanho_bloco, args.semente, ufs)
+    print(f"{args.linhas} registros sintéticos gravados em '{args.saida}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+import sys
+
+import pytest
+
+from cesta_pof.cli import main
+from cesta_pof.sintetico import gerar_csv
+
+
+@pytest.fixture
+def sem_engines(monkeypatch):
+    # Um módulo None em sys.modules faz o import falhar com ImportError
+    for modulo in ('xlsxwriter', 'openpyxl', 'pyarrow', 'fastparquet'):
+        monkeypatch.setitem(sys.modules, modulo, None)
+
+
+def test_main_sem_engines(tmp_path, sem_engines, capsys):
+    entrada = gerar_csv(str(tmp_path / 'pof.csv'), 3_000, semente=4, ufs={35: 1.0})
+    saida, tabelas = tmp_path / 'relatorio.xlsx', tmp_path / 'tabelas'
+    assert main([entrada, '--uf', '35', '--sem-cache', '--saida', str(saida), '--dir-tabelas', str(tabelas)]) == 0
+    mensagens = capsys.readouterr().out
+    assert 'pip install xlsxwriter' in mensagens and 'pip install pyarrow' in mensagens
+    assert not saida.exists()
+    assert list(tabelas.glob('*.csv')) and not list(tabelas.glob('*.parquet'))
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from cesta_pof.graficos import dados_graficos, kde_binned
+from cesta_pof.pipeline import analisar_uf
+from cesta_pof.sintetico import gerar_registros
+
+
+@pytest.fixture(scope='module')
+def resultado_ponderado():
+    registros = gerar_registros(40_000, semente=7, ufs={35: 1.0})
+    return analisar_uf(registros, uf=35, fator_expansao='peso_final')
+
+
+def _altura(curva, valor):
+    # Altura da ECDF (função degrau) no ponto: último x <= valor
+    x, y = curva
+    k = np.searchsorted(x, valor, side='right')
+    return y[k - 1] if k else 0.0
+
+
+def test_marcadores_ponderados_sobre_a_curva(resultado_ponderado):
+    cumulativo = dados_graficos(resultado_ponderado)['cumulativo']
+    for valor, real, nominal in cumulativo['marcadores']:
+        assert real == pytest.approx(_altura(cumulativo['real'], valor), abs=1e-12)
+        assert nominal == pytest.approx(_altura(cumulativo['nominal'], valor), abs=1e-12)
+    inferior, superior = cumulativo['ylim']
+    reais = cumulativo['marcadores'][:, 1]
+    assert inferior - 1e-12 <= reais.min() and reais.max() <= superior + 1e-12
+
+
+def test_pesos_mudam_a_curva(resultado_ponderado):
+    # Com a elasticidade negativa do peso sintético, os domicílios mais pobres pesam mais
+    cumulativo = dados_graficos(resultado_ponderado)['cumulativo']
+    x, y = cumulativo['real']
+    sem_pesos = np.searchsorted(np.sort(resultado_ponderado.referencia.df_final['gasto_real'].to_numpy()),
+                                x, side='right') / len(resultado_ponderado.referencia.df_final)
+    assert (y > sem_pesos + 1e-9).any()
+
+
+def test_kde_com_pesos_iguais_e_sem_pesos():
+    valores = np.random.default_rng(0).lognormal(6, 0.5, 500)
+    grade, densidade = kde_binned(valores)
+    grade_p, densidade_p = kde_binned(valores, pesos=np.full(len(valores), 2.5))
+    np.testing.assert_allclose(grade_p, grade)
+    np.testing.assert_allclose(densidade_p, densidade, atol=1e-15)
@@ -0,0 +1,44 @@
+import sys
+
+import pytest
+
+from cesta_pof.ingestao import ler_fator_expansao
+from cesta_pof.lote import executar_todos_estados, main
+from cesta_pof.sintetico import gerar_csv
+
+
+@pytest.fixture(scope='module')
+def csv_sp(tmp_path_factory):
+    return gerar_csv(str(tmp_path_factory.mktemp('pof') / 'pof.csv'), 2_000, semente=3, ufs={35: 1.0})
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_sem_registros_da_uf(csv_sp, incremental):
+    with pytest.raises(ValueError, match='Nenhum registro'):
+        executar_todos_estados(csv_sp, ufs=[99], processos=1, dir_cache=None, incremental=incremental)
+
+
+def test_main_sem_registros_da_uf(csv_sp, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)  # o cache Parquet padrão fica no diretório corrente
+    saida = tmp_path / 'relatorio.xlsx'
+    assert main([csv_sp, '--ufs', '99', '--processos', '1', '--saida', str(saida)]) == 1
+    assert 'Nenhum registro' in capsys.readouterr().err
+    assert not saida.exists()
+
+
+def test_uf_sem_fator_expansao(tmp_path):
+    entrada = gerar_csv(str(tmp_path / 'pof.csv'), 3_000, semente=5, ufs={35: 1.0, 33: 1.0})
+    pesos = ler_fator_expansao(entrada, 'peso_final')
+    pesos = pesos[pesos.index.get_level_values('uf') == 35]
+    with pytest.raises(ValueError, match='UF.* 33'):
+        executar_todos_estados(entrada, processos=1, dir_cache=None, fator_expansao=pesos)
+
+
+def test_main_sem_excel(csv_sp, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    for modulo in ('xlsxwriter', 'openpyxl', 'pyarrow', 'fastparquet'):
+        monkeypatch.setitem(sys.modules, modulo, None)
+    assert main([csv_sp, '--processos', '1', '--saida', 'todos.xlsx']) == 0
+    assert 'pip install xlsxwriter' in capsys.readouterr().out
+    assert not (tmp_path / 'todos.xlsx').exists()
+    assert list((tmp_path / 'todos').glob('*.csv'))
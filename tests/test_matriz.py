@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cesta_pof.matriz import MatrizSubitens, linhas_lote
+
+
+def test_colunas_matriz_sem_subitens():
+    matriz = MatrizSubitens(np.zeros((2, 0)), np.zeros((2, 0), dtype=np.int32), pd.Index([1, 2]),
+                            np.zeros(0, dtype=np.int64), [], np.zeros(0, dtype=np.int64))
+    assert len(matriz.colunas([1201009])) == 0
+    assert matriz.mascara([1201009]).shape == (0,)
+
+
+def test_linhas_lote_pesos_unitarios():
+    rng = np.random.default_rng(11)
+    nominal = rng.lognormal(7, 1, (500, 6))
+    contagem = (rng.random((500, 6)) > 0.1).astype(np.int64)
+    nominal[:5, 0] = 1e6  # descartados pelo corte de MAD
+    sem_pesos = linhas_lote(nominal, contagem)
+    com_pesos = linhas_lote(nominal, contagem, pesos=np.ones(500))
+    for nome, valores in sem_pesos.items():
+        assert com_pesos[nome] == pytest.approx(valores, rel=1e-12), nome
+    assert sem_pesos['descartadas_mad'][0] >= 5
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from cesta_pof.bootstrap import quantil_linhas, somas_acumuladas
+from cesta_pof.ponderado import mediana_ponderada, normalizar_pesos, quantil_ponderado, quantis_colunas
+
+QUANTIS = [0.0, 0.1, 0.35, 0.5, 0.9, 1.0]
+
+
+@pytest.mark.parametrize('peso', [7.3, 0.1])
+@pytest.mark.parametrize('n', [1, 2, 3, 10, 1001])
+def test_pesos_iguais_como_np_quantile(peso, n):
+    valores = np.sort(np.random.default_rng(n).lognormal(7, 1, n))
+    pesos = np.full(n, peso)
+    esperado = np.quantile(valores, QUANTIS)
+    assert quantil_ponderado(valores, pesos, QUANTIS) == pytest.approx(esperado, rel=1e-12)
+    colunas = [quantis_colunas(valores[:, None], pesos[:, None], q)[0] for q in QUANTIS]
+    assert colunas == pytest.approx(esperado, rel=1e-12)
+    acumulado = somas_acumuladas(normalizar_pesos(pesos)[None, :])
+    linhas = [quantil_linhas(valores, acumulado, q)[0] for q in QUANTIS]
+    assert linhas == pytest.approx(esperado, rel=1e-12)
+
+
+def test_mediana_pesos_iguais():
+    valores = np.arange(1001.0)
+    assert mediana_ponderada(valores, np.full(1001, 0.1)) == 500.0
+    assert quantil_ponderado(np.array([1.0, 2.0, 3.0]), np.full(3, 7.3), 0.5) == 2.0
@@ -0,0 +1,14 @@
+import pytest
+
+from cesta_pof.relatorio import nome_arquivo
+
+
+@pytest.mark.parametrize('aba, esperado', [
+    ('Comparacao_Faixa_±20%', 'Comparacao_Faixa_20'),
+    ('Analise_Real_vs_Nominal', 'Analise_Real_vs_Nominal'),
+    ('Cesta até a linha', 'Cesta_at_a_linha'),
+    ('a__b', 'a_b'),
+    ('%%', 'tabela'),
+])
+def test_nome_arquivo(aba, esperado):
+    assert nome_arquivo(aba) == esperado
@@ -0,0 +1,21 @@
+import pytest
+
+from cesta_pof.servico import ErroConsulta, main, parametros_consulta
+
+
+@pytest.mark.parametrize('nome, valor', [
+    ('deflator', 'nan'),
+    ('deflator', 'inf'),
+    ('quantil', 'nan'),
+    ('multiplicador_mad', 'inf'),
+    ('multiplicador_mad', '-inf'),
+])
+def test_parametro_nao_finito(nome, valor):
+    with pytest.raises(ErroConsulta, match=nome) as erro:
+        parametros_consulta({'uf': '26', nome: valor})
+    assert erro.value.status == 400
+
+
+def test_main_sem_arquivo(tmp_path, capsys):
+    assert main([str(tmp_path / 'ausente.csv')]) == 1
+    assert 'não encontrado' in capsys.readouterr().err